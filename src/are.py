@@ -0,0 +1,131 @@
+from   collections import namedtuple
+from   concurrent.futures import ThreadPoolExecutor
+import os
+import struct
+
+from   fileio import write_if_changed
+from   key import RESType
+
+# AREA V1.0: only the header and the rest encounter section are parsed, in place; everything else is carried over byte for byte. Mirrors ARE_* in main.odin
+ARE_HEADER = struct.Struct( '<4s4s8sII' + '8sI' * 4 + 'HHHHHH' + 'IHHIIIIIIHHIIHHIIIHH8s' + 'I' * 14 + '8s8s' )
+ARE_Header = namedtuple( 'ARE_Header', ' '.join( [
+    'signature version wed_resource last_saved area_flags',
+    'north_resref north_flags east_resref east_flags south_resref south_flags west_resref west_flags',
+    'area_flags2 rain_probability snow_probability fog_probability lightning_probability overlay_transparency_or_wind_speed',
+    'offset_actors num_actors num_regions offset_regions offset_spawns num_spawns offset_entrances num_entrances',
+    'offset_containers num_containers num_items offset_items offset_verticies num_verticies num_ambients offset_ambients',
+    'offset_variables num_variables num_object_flags offset_object_flags area_script size_explored_bitmask offset_explored_bitmask',
+    'num_doors offset_doors num_animations offset_animations num_tiled_objects offset_tiled_objects offset_songs offset_rest_encounters',
+    'offset_automap_notes num_automap_notes offset_projectile_traps num_projectile_traps rest_movie_day rest_movie_night',
+] ) )
+ARE_REST_ENCOUNTER = struct.Struct( '<32s10I80sHHIHHHHHH56s' ) # creature_refs as one [10]RESREF block
+ARE_RestEncounter = namedtuple( 'ARE_RestEncounter', 'name creature_strings creature_refs creature_count difficulty removal_time distance_wander distance_follow '
+                                                     'max_creature_spawns is_active spawn_probability_per_hour_day spawn_probability_per_hour_night' )
+assert ARE_HEADER.size == 0xe4 and ARE_REST_ENCOUNTER.size == 0xe4
+
+U16 = struct.Struct( '<H' )
+REST_U16_FIELDS = { name: 0x98 + 2 * i for i, name in enumerate( ['creature_count', 'difficulty'] ) } # :: Map FieldName -> offset within ARE_RestEncounter
+REST_U16_FIELDS.update( { name: 0xa0 + 2 * i for i, name in enumerate( ['distance_wander', 'distance_follow', 'max_creature_spawns', 'is_active',
+                                                                          'spawn_probability_per_hour_day', 'spawn_probability_per_hour_night'] ) } )
+REST_CREATURE_REFS = 0x48
+
+def resref( raw ):
+    return raw.split( b'\0', 1 )[0].decode( 'latin-1' )
+
+class Are:
+    '''ARE over a writable buffer (bytearray). Reads unpack_from a memoryview and writes pack_into it, so patching never rebuilds the file'''
+    def __init__( self, buf ):
+        self.buf = buf
+        self.view = memoryview( buf )
+        self.header = ARE_Header._make( ARE_HEADER.unpack_from( self.view, 0 ) )
+        assert self.header.signature == b'AREA', "Unexpected signature"
+        assert self.header.version == b'V1.0', "Unexpected version"
+        self.offset_rest = self.header.offset_rest_encounters
+        assert self.offset_rest + ARE_REST_ENCOUNTER.size <= len( buf ), "Rest encounters out of bounds"
+    def release( self ):
+        self.view.release()
+    def __enter__( self ): return self
+    def __exit__( self, *exc ): self.release()
+    @property
+    def name( self ): return resref( self.header.wed_resource )
+    def rest( self ):
+        name, *strings, refs, count, difficulty, removal, wander, follow, spawns, active, day, night, _ = ARE_REST_ENCOUNTER.unpack_from( self.view, self.offset_rest )
+        return ARE_RestEncounter( name, strings, [ resref( refs[ i : i + 8 ] ) for i in range( 0, 80, 8 ) ], count, difficulty, removal, wander, follow, spawns, active, day, night )
+    def rest_raw( self ):
+        return self.view[ self.offset_rest : self.offset_rest + ARE_REST_ENCOUNTER.size ]
+    def set_rest( self, **fields ):
+        '''Overwrite u16 fields of the rest encounter in place; creature_refs0 sets the first RESREF'''
+        for name, value in fields.items():
+            if name == 'creature_refs0':
+                self.view[ self.offset_rest + REST_CREATURE_REFS : self.offset_rest + REST_CREATURE_REFS + 8 ] = value.encode( 'latin-1' )[:8].ljust( 8, b'\0' )
+            else:
+                U16.pack_into( self.view, self.offset_rest + REST_U16_FIELDS[ name ], value )
+
+RestPolicy = namedtuple( 'RestPolicy', 'spawns_scale spawns_min spawns_max probability_scale probability_min probability_max' )
+DEFAULT_POLICY = RestPolicy( 5, 10, 30, 1.00, 1, 12 ) # what update_area does
+def clamp( x, lo, hi ): return min( max( x, lo ), hi )
+def rest_updates( pristine, policy = DEFAULT_POLICY ):
+    '''New rest encounter fields for an area, computed from its pristine ARE'''
+    rest = pristine.rest()
+    return {
+        'is_active': rest.is_active, # fix IsActive flag
+        # how many monsters will spawn? sometimes less than this due to encounter difficulty or spawngroup difficulty
+        'max_creature_spawns': clamp( rest.max_creature_spawns * policy.spawns_scale, policy.spawns_min, policy.spawns_max ),
+        # hourly (while sleeping) chance of ambush. Higher than 10-12%/hr seems brutal
+        'spawn_probability_per_hour_day': clamp( int( rest.spawn_probability_per_hour_day * policy.probability_scale ), policy.probability_min, policy.probability_max ),
+        'spawn_probability_per_hour_night': clamp( int( rest.spawn_probability_per_hour_night * policy.probability_scale ), policy.probability_min, policy.probability_max ),
+        'creature_refs0': 'RD' + resref( pristine.header.wed_resource[:6] ), # replace rest encounters with the spawngroup reference
+        'creature_count': 1,
+    }
+def update_area( pristine, actual, policy = DEFAULT_POLICY ):
+    '''(new, new_pristine) bytearrays: actual with its rest encounter rewritten from pristine, and pristine with that rest encounter copied in. Mirrors update_area in main.odin'''
+    new, new_pristine = bytearray( actual ), bytearray( pristine )
+    with Are( new_pristine ) as p, Are( new ) as n:
+        n.set_rest( **rest_updates( p, policy ) )
+        p.rest_raw()[:] = n.rest_raw()
+    return new, new_pristine
+
+def read( path ):
+    with open( path, 'rb' ) as f:
+        return f.read()
+def patch_area( area, dir_pristine, dir_override, policy = DEFAULT_POLICY, pristine = None, write_pristine = False ):
+    '''Patch override/<area>.ARE (created from the pristine copy if absent). pristine: bytes when not in dir_pristine (e.g. from a BIF).
+    Returns (area, wrote)'''
+    filename = f'{area}.ARE'
+    if pristine is None: pristine = read( os.path.join( dir_pristine, filename ) )
+    try:
+        actual = read( os.path.join( dir_override, filename ) )
+    except FileNotFoundError:
+        actual = pristine
+    new, new_pristine = update_area( pristine, actual, policy )
+    wrote = write_if_changed( os.path.join( dir_override, filename ), new )
+    if write_pristine: write_if_changed( os.path.join( dir_pristine, filename ), new_pristine )
+    return area, wrote
+def patch_areas( areas, dir_pristine, dir_override, policy = DEFAULT_POLICY, workers = 8, key = None, bifs = None, write_pristine = False, warn = print ):
+    '''patch_area for every area on a thread pool (the work is file I/O). Areas missing from dir_pristine are read from BIFs via key/bifs (key.Key, bif.BifCache)
+    when given, else skipped; so are areas whose BIF is missing on disk, reported through warn. Returns Map AreaName -> wrote'''
+    jobs = []
+    for area in areas:
+        pristine = None
+        if not os.path.exists( os.path.join( dir_pristine, f'{area}.ARE' ) ):
+            res = key.lookup( area, RESType.ARE ) if key else None
+            if res is None: continue
+            try:
+                pristine = bifs.extract( key, res, clone=True ) # BifCache is not thread safe; the views are cloned here
+            except FileNotFoundError as e:
+                warn( f"Warning: Area {area} is in {e.filename}, which is missing. Skipping its ARE" )
+                continue
+        jobs.append( (area, pristine) )
+    with ThreadPoolExecutor( workers ) as pool:
+        return dict( pool.map( lambda job: patch_area( job[0], dir_pristine, dir_override, policy, job[1], write_pristine ), jobs ) )
+
+if __name__ == '__main__':
+    from time import perf_counter
+    for path in ['bin/game/override/AR1200.ARE', 'bin/game/override/AR9714.ARE']:
+        data = read( path )
+        t = perf_counter()
+        new, new_pristine = update_area( data, data )
+        dt = perf_counter() - t
+        with Are( bytearray( data ) ) as before, Are( new ) as after:
+            print( f'{before.name}: {before.rest()[3:]} -> {after.rest()[3:]} ({1e6*dt:.1f} us)' )
+        assert new == new_pristine and len( new ) == len( data )
@@ -0,0 +1,106 @@
+from   collections import Counter
+import json
+import platform
+import random
+from   time import perf_counter
+
+import spawngroups as sg
+
+# Speed and apportionment quality of the compute_spawner_slots* variants (and the heap allocator) over synthetic enemy distributions
+VARIANTS = {
+    'compute_spawner_slots': sg.compute_spawner_slots,
+    'jank_ratio': sg.compute_spawner_slots_with_guarantees_jank_ratio,
+    'steal_from_rich': sg.compute_spawner_slots_with_guarantees_steal_from_rich,
+    'steal_by_ratio': sg.compute_spawner_slots_with_guarantees_steal_by_ratio,
+    'heap': sg.compute_spawner_slots_heap,
+}
+def batch_steal_by_ratio( enemy_lists, num_slots ):
+    counts, names = sg.build_count_matrix( enemy_lists )
+    return sg.compute_spawner_slots_batch( counts, names, num_slots )
+BATCH_VARIANTS = { 'batch_steal_by_ratio': batch_steal_by_ratio } # take every case of one num_slots at once
+
+def make_cases( num_slots_list = (4, 8, 16, 32, 64), distinct_list = (1, 2, 3, 5, 8, 12, 20, 40), skews = (0.0, 1.0, 2.0), per_cell = 20, seed = 1 ):
+    '''[](params, enemy_list). skew is the Zipf exponent of enemy frequencies (0 = uniform)'''
+    rng = random.Random( seed )
+    cases = []
+    for num_slots in num_slots_list:
+        for distinct in distinct_list:
+            names = [ f'MOB{i:02d}' for i in range( distinct ) ]
+            for skew in skews:
+                weights = [ 1 / (rank + 1) ** skew for rank in range( distinct ) ]
+                for _ in range( per_cell ):
+                    size = rng.randint( distinct, 6 * distinct + 10 )
+                    enemy_list = names + rng.choices( names, weights, k=size - distinct ) # every name at least once
+                    rng.shuffle( enemy_list )
+                    cases.append( ({ 'num_slots': num_slots, 'distinct': distinct, 'skew': skew }, enemy_list) )
+    return cases
+def score( slots, enemy_list, num_slots ):
+    '''Deviation of slot counts from the ideal share (count/total * num_slots) of every distinct enemy'''
+    counts = Counter( enemy_list )
+    total = sum( counts.values() )
+    got = Counter( s for s in slots if s != '*' )
+    devs = [ abs( got[e] - c / total * num_slots ) for e, c in counts.items() ]
+    missing = sum( 1 for e in counts if got[e] == 0 )
+    return {
+        'l1': sum( devs ),
+        'max_dev': max( devs ),
+        'min_one_violation': len( counts ) <= num_slots and missing > 0,
+        'bad_length': len( slots ) != num_slots,
+        'unfilled': slots.count( '*' ),
+    }
+def summarize( scores, seconds, calls ):
+    n = len( scores )
+    return {
+        'calls': calls,
+        'seconds': seconds,
+        'calls_per_sec': calls / seconds if seconds else None,
+        'l1_mean': sum( s['l1'] for s in scores ) / n,
+        'l1_max': max( s['l1'] for s in scores ),
+        'max_dev_max': max( s['max_dev'] for s in scores ),
+        'min_one_violations': sum( s['min_one_violation'] for s in scores ),
+        'bad_length': sum( s['bad_length'] for s in scores ),
+        'unfilled_slots': sum( s['unfilled'] for s in scores ),
+    }
+def measure( call, by_slots, repeat ):
+    '''call( enemy_lists, num_slots ) -> slot lists. Best-of-repeat time per num_slots, scored'''
+    per_slots, all_scores, all_seconds, calls = {}, [], 0.0, 0
+    for num_slots, enemy_lists in by_slots.items():
+        best = float( 'inf' )
+        for _ in range( repeat ):
+            t = perf_counter()
+            results = call( enemy_lists, num_slots )
+            best = min( best, perf_counter() - t )
+        scores = [ score( slots, enemy_list, num_slots ) for slots, enemy_list in zip( results, enemy_lists ) ]
+        per_slots[ num_slots ] = summarize( scores, best, len( enemy_lists ) )
+        all_scores += scores
+        all_seconds += best
+        calls += len( enemy_lists )
+    return { 'overall': summarize( all_scores, all_seconds, calls ), 'by_num_slots': per_slots }
+def run( cases, repeat = 3 ):
+    '''Report :: { meta, variants: Map Name -> { overall, by_num_slots: Map NumSlots -> summary } }'''
+    by_slots = {} # :: Map NumSlots -> [][?]CreatureName
+    for params, enemy_list in cases: by_slots.setdefault( params['num_slots'], [] ).append( enemy_list )
+
+    report = { 'meta': { 'cases': len( cases ), 'repeat': repeat, 'python': platform.python_version() }, 'variants': {} }
+    for name, fn in VARIANTS.items():
+        report['variants'][ name ] = measure( lambda enemy_lists, num_slots: [ fn( e, num_slots ) for e in enemy_lists ], by_slots, repeat )
+    for name, fn in BATCH_VARIANTS.items():
+        report['variants'][ name ] = measure( fn, by_slots, repeat )
+    return report
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser( description='Benchmark throughput and apportionment error of the compute_spawner_slots variants' )
+    parser.add_argument( '--out', default='bin/bench_slots.json' )
+    parser.add_argument( '--seed', type=int, default=1 )
+    parser.add_argument( '--per-cell', type=int, default=20 )
+    parser.add_argument( '--repeat', type=int, default=3 )
+    args = parser.parse_args()
+
+    report = run( make_cases( per_cell=args.per_cell, seed=args.seed ), args.repeat )
+    with open( args.out, 'w' ) as f:
+        json.dump( report, f, indent=1 )
+    print( f"{'variant':24} {'calls/s':>10} {'l1 mean':>8} {'l1 max':>7} {'maxdev':>7} {'min1 viol':>9}" )
+    for name, v in report['variants'].items():
+        o = v['overall']
+        print( f"{name:24} {o['calls_per_sec']:10.0f} {o['l1_mean']:8.3f} {o['l1_max']:7.2f} {o['max_dev_max']:7.2f} {o['min_one_violations']:9}" )
@@ -0,0 +1,94 @@
+from   collections import OrderedDict, namedtuple
+import mmap
+import os
+import struct
+
+from   key import RESType
+
+# BIFF V1 archive: header, file table, tileset table. Mirrors BIF_* in main.odin
+BIF_HEADER = struct.Struct( '<4s4sIII' ) # signature, version, num_files, num_tilesets, offset_files
+BIF_FILE = struct.Struct( '<IIIHH' ) # locator, offset, size, type, unknown
+BIF_TILESET = struct.Struct( '<IIIIHH' ) # locator, offset, num_tiles, sizeof_tile, type, unknown
+assert BIF_HEADER.size == 20 and BIF_FILE.size == 16 and BIF_TILESET.size == 20
+
+BifFile = namedtuple( 'BifFile', 'offset size type' )
+BifTileset = namedtuple( 'BifTileset', 'offset num_tiles sizeof_tile' )
+
+class Bif:
+    '''Memory-mapped BIF. Tables are parsed once; resources are returned as memoryview slices of the mapping'''
+    def __init__( self, path ):
+        self.path = path
+        with open( path, 'rb' ) as f:
+            self.mm = mmap.mmap( f.fileno(), 0, access=mmap.ACCESS_READ )
+        self.view = memoryview( self.mm )
+
+        signature, version, num_files, num_tilesets, offset_files = BIF_HEADER.unpack_from( self.view, 0 )
+        assert signature == b'BIFF', "Unexpected signature"
+        assert version == b'V1  ', "Unexpected version"
+
+        self.files = {} # :: Map FileIndex -> BifFile (Locator.file)
+        for loc, offset, size, res_type, _ in BIF_FILE.iter_unpack( self.view[ offset_files : offset_files + num_files * BIF_FILE.size ] ):
+            self.files[ loc & 0x3fff ] = BifFile( offset, size, res_type )
+
+        self.tilesets = {} # :: Map TilesetIndex -> BifTileset (Locator.tileset)
+        offset_tiles = offset_files + num_files * BIF_FILE.size
+        for loc, offset, num_tiles, sizeof_tile, res_type, _ in BIF_TILESET.iter_unpack( self.view[ offset_tiles : offset_tiles + num_tilesets * BIF_TILESET.size ] ):
+            assert res_type == RESType.TIS, "Unexpected tileset type"
+            self.tilesets[ (loc >> 14) & 0x3f ] = BifTileset( offset, num_tiles, sizeof_tile )
+    def close( self ):
+        '''Unmap now if no resource views are still alive, otherwise the mapping goes away with the last view'''
+        self.view.release()
+        try:
+            self.mm.close()
+        except BufferError:
+            pass
+    def __enter__( self ): return self
+    def __exit__( self, *exc ): self.close()
+    def file( self, index, clone = False ):
+        f = self.files[ index ]
+        buf = self.view[ f.offset : f.offset + f.size ]
+        return buf.tobytes() if clone else buf
+    def tileset( self, index, clone = False ):
+        t = self.tilesets[ index ]
+        buf = self.view[ t.offset : t.offset + t.num_tiles * t.sizeof_tile ]
+        return buf.tobytes() if clone else buf
+
+class BifCache:
+    '''Bounded LRU of open Bifs, so bulk extraction maps each archive once'''
+    def __init__( self, game_base, maxsize = 16 ):
+        self.game_base = game_base
+        self.maxsize = maxsize
+        self.open = OrderedDict() # :: Map BifName -> Bif
+    def get( self, bif_name ):
+        bif = self.open.get( bif_name )
+        if bif is not None:
+            self.open.move_to_end( bif_name )
+            return bif
+        bif = self.open[ bif_name ] = Bif( os.path.join( self.game_base, bif_name ) )
+        while len( self.open ) > self.maxsize:
+            self.open.popitem( last=False )[1].close()
+        return bif
+    def extract( self, key, res, clone = False ):
+        '''Bytes of a KeyResource (see key.Key.lookup) from its BIF'''
+        bif = self.get( key.bif_name( res ) )
+        if res.type == RESType.TIS:
+            return bif.tileset( res.tileset, clone )
+        return bif.file( res.file, clone )
+    def close( self ):
+        while self.open:
+            self.open.popitem()[1].close()
+    def __enter__( self ): return self
+    def __exit__( self, *exc ): self.close()
+
+if __name__ == '__main__':
+    from time import perf_counter
+    t0 = perf_counter()
+    with Bif( 'bin/game/data/AR120X.bif' ) as bif:
+        t1 = perf_counter()
+        views = [ bif.file( i ) for i in bif.files ] + [ bif.tileset( i ) for i in bif.tilesets ]
+        t2 = perf_counter()
+        total = sum( len( v ) for v in views )
+        copies = [ v.tobytes() for v in views ]
+        t3 = perf_counter()
+        for v in views: v.release()
+    print( f'AR120X.bif: open {1e3*(t1-t0):.2f} ms, {len( views )} resources ({total} b) as views {1e3*(t2-t1):.3f} ms, cloned {1e3*(t3-t2):.2f} ms' )
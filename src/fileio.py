@@ -0,0 +1,30 @@
+import os
+import tempfile
+
+# Atomic file replacement shared by every writer: temp file next to the target + rename, keeping the target's mode
+UMASK = os.umask( 0 ); os.umask( UMASK ) # read once; os.umask can only be queried by setting it, which would race writer threads
+def write_atomic( path, data ):
+    '''Replace path with data: str (written with newline=''), bytes or an iterable of bytes chunks. Readers see the old or the new file, never a partial one'''
+    try:
+        mode = os.stat( path ).st_mode & 0o777
+    except FileNotFoundError:
+        mode = 0o666 & ~UMASK
+    fd, path_tmp = tempfile.mkstemp( dir=os.path.dirname( os.path.abspath( path ) ), prefix=os.path.basename( path ), suffix='.tmp' )
+    try:
+        with (os.fdopen( fd, 'w', newline='' ) if isinstance( data, str ) else os.fdopen( fd, 'wb' )) as f:
+            if isinstance( data, (str, bytes, bytearray, memoryview) ): f.write( data )
+            else: f.writelines( data )
+        os.chmod( path_tmp, mode ) # mkstemp creates 0600
+        os.replace( path_tmp, path )
+    except BaseException:
+        os.unlink( path_tmp )
+        raise
+def write_if_changed( path, data ):
+    '''write_atomic only if the contents differ. Returns whether it wrote'''
+    try:
+        with (open( path, newline='' ) if isinstance( data, str ) else open( path, 'rb' )) as f:
+            if f.read() == data: return False
+    except FileNotFoundError:
+        pass
+    write_atomic( path, data )
+    return True
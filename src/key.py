@@ -0,0 +1,89 @@
+from   collections import namedtuple
+from   enum import IntEnum
+import mmap
+import struct
+
+# chitin.key: header, BIF table, resource table. Mirrors KEY_* in main.odin
+class RESType( IntEnum ):
+    NONE = 0
+    BMP = 0x001
+    WAVC = 0x004
+    BAM = 0x3e8
+    WED = 0x3e9
+    TIS = 0x3eb
+    MOSC = 0x3ec
+    ITM = 0x3ed
+    SPL = 0x3ee
+    BCS = 0x3ef
+    IDS = 0x3f0
+    CRE = 0x3f1
+    ARE = 0x3f2
+    _2DA = 0x3f4
+    GAM = 0x3f5
+    STO = 0x3f6
+    EFF = 0x3f8
+    PVRZ = 0x404
+
+KEY_HEADER = struct.Struct( '<4s4sIIII' ) # signature, version, num_bifs, num_resources, offset_bifs, offset_resources
+KEY_BIF = struct.Struct( '<IIHH' ) # size, offset_name, len_name (incl null), location_bits
+KEY_RESOURCE = struct.Struct( '<8sHI' ) # name, type, locator (packed, 14b)
+assert KEY_HEADER.size == 24 and KEY_BIF.size == 12 and KEY_RESOURCE.size == 14
+
+KeyBIF = namedtuple( 'KeyBIF', 'name size location_bits' )
+KeyResource = namedtuple( 'KeyResource', 'name type bif tileset file' ) # bif/tileset/file unpacked from the Locator
+
+def locator_unpack( loc ):
+    '''Locator :: bit_field u32 { file: 14, tileset: 6, bif: 12 } -> (bif, tileset, file)'''
+    return loc >> 20, (loc >> 14) & 0x3f, loc & 0x3fff
+
+class Key:
+    '''Memory-mapped chitin.key. Tables are parsed in place with unpack_from and indexed by (lowercase resref, RESType)'''
+    def __init__( self, path ):
+        self.path = path
+        with open( path, 'rb' ) as f:
+            self.mm = mmap.mmap( f.fileno(), 0, access=mmap.ACCESS_READ )
+        self.view = memoryview( self.mm )
+
+        signature, version, num_bifs, num_resources, offset_bifs, offset_resources = KEY_HEADER.unpack_from( self.view, 0 )
+        assert signature == b'KEY ', "Unexpected signature"
+        assert version == b'V1  ', "Unexpected version"
+
+        self.bifs = [] # :: [BifIndex]KeyBIF
+        for size, offset_name, len_name, location_bits in KEY_BIF.iter_unpack( self.view[ offset_bifs : offset_bifs + num_bifs * KEY_BIF.size ] ):
+            name = self.view[ offset_name : offset_name + len_name - 1 ].tobytes().decode( 'latin-1' ) # -1 to exclude null terminator
+            self.bifs.append( KeyBIF( name, size, location_bits ) )
+
+        self.index = {} # :: Map (lowercase resref, RESType) -> KeyResource
+        table = self.view[ offset_resources : offset_resources + num_resources * KEY_RESOURCE.size ]
+        for raw_name, res_type, loc in KEY_RESOURCE.iter_unpack( table ):
+            name = raw_name.split( b'\0', 1 )[0].decode( 'latin-1' )
+            key = (name.lower(), res_type)
+            if key not in self.index: # first entry wins, same as the linear scan in locate_resource
+                self.index[ key ] = KeyResource( name, res_type, *locator_unpack( loc ) )
+        table.release()
+    def close( self ):
+        self.view.release()
+        self.mm.close()
+    def __enter__( self ): return self
+    def __exit__( self, *exc ): self.close()
+    def __len__( self ): return len( self.index )
+    def __contains__( self, key ): return self.lookup( *key ) is not None
+    def lookup( self, name, res_type ):
+        '''KeyResource for name (case-insensitive) and res_type, or None'''
+        return self.index.get( (name.lower(), res_type) )
+    def bif_name( self, res ):
+        return self.bifs[ res.bif ].name
+    def resources( self, res_type = None ):
+        return [ res for res in self.index.values() if res_type is None or res.type == res_type ]
+
+if __name__ == '__main__':
+    from time import perf_counter
+    t0 = perf_counter()
+    key = Key( 'bin/game/chitin.key' )
+    t1 = perf_counter()
+    names = [ (res.name, res.type) for res in key.resources() ]
+    found = sum( 1 for name, res_type in names if key.lookup( name.upper(), res_type ) )
+    t2 = perf_counter()
+    print( f'{len( key.bifs )} bifs, {len( key )} resources indexed in {1e3*(t1-t0):.1f} ms; {found} lookups in {1e3*(t2-t1):.1f} ms' )
+    print( key.lookup( 'ar1200', RESType.ARE ), key.bif_name( key.lookup( 'AR1200', RESType.ARE ) ) )
+    key.close()
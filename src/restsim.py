@@ -0,0 +1,145 @@
+from   collections import namedtuple
+import json
+import os
+from   time import perf_counter
+
+import numpy as np
+
+import are
+import spawngroups as sg
+
+# Monte Carlo of resting in every area with the generated RD<area> spawn groups, to tune DEFAULT_DIFFICULTY, the slot tables and the ARE rest policy
+# without playing it out. Model of one rest (all of it vectorized over areas x rests):
+#   - starts at a uniform random hour and lasts REST_HOURS; each hour rolls the day or night spawn probability (%) until the first ambush
+#   - an ambush spawns clamp( party_levels // group difficulty, 1, max_creature_spawns ) creatures, each from a uniform random slot; '*' slots spawn nothing
+REST_HOURS = 8
+DAY_HOURS = range( 6, 21 ) # 06:00-20:59
+RestParams = namedtuple( 'RestParams', 'max_creature_spawns spawn_probability_per_hour_day spawn_probability_per_hour_night' )
+DEFAULT_REST = RestParams( are.DEFAULT_POLICY.spawns_max, are.DEFAULT_POLICY.probability_max, are.DEFAULT_POLICY.probability_max ) # areas without an ARE: the largest, most frequent ambushes the policy allows
+
+def rest_params( areas, dir_are = None ):
+    '''Map AreaName -> RestParams read from the (patched) <area>.ARE files in dir_are, DEFAULT_REST for areas without one or without dir_are'''
+    params = {}
+    for area in areas:
+        params[ area ] = DEFAULT_REST
+        if dir_are is None: continue
+        try:
+            with open( os.path.join( dir_are, f'{area}.ARE' ), 'rb' ) as f:
+                data = f.read()
+        except FileNotFoundError:
+            continue
+        with are.Are( bytearray( data ) ) as a:
+            rest = a.rest()
+        params[ area ] = RestParams( rest.max_creature_spawns, rest.spawn_probability_per_hour_day, rest.spawn_probability_per_hour_night )
+    return params
+def group_arrays( groups, creatures ):
+    '''RD groups of a SPAWNGRP Table2DA as arrays: (areas, slots :: [A, S] creature rows (-1 empty or unknown), difficulty :: [A])'''
+    names = [ name for name in groups.names if name.startswith( 'RD' ) ]
+    slots = np.array( [ [ creatures.index.get( mob.lower(), -1 ) if mob != '*' else -1 for mob in groups[ name ][1:] ] for name in names ], dtype=np.int64 ).reshape( len( names ), groups.nrows - 1 )
+    difficulty = np.array( [ int( groups[ name ][0] ) for name in names ], dtype=np.int64 )
+    return [ name[2:] for name in names ], slots, difficulty
+def simulate( slots, difficulty, params, power, rests = 100_000, party_levels = 60, power_samples = 2000, seed = 1, chunk = 1 << 22 ):
+    '''Vectorized simulation of rests per area. slots :: [A, S], difficulty :: [A], params :: [A]RestParams, power :: [CreatureRow]float.
+    Returns { ambushes [A], ambush_hours [A, REST_HOURS], spawns [A], slot_picks [A, S], encounter_power [A, power_samples] }'''
+    rng = np.random.default_rng( seed )
+    num_areas, num_slots = slots.shape
+    p = np.array( params, dtype=np.float64 ).reshape( num_areas, 3 )
+    day = np.isin( np.arange( 24 ), list( DAY_HOURS ) )
+
+    # hourly ambush rolls until the first hit, rests in batches of ~chunk area-rests
+    chance_day, chance_night = (p[:, 1:2] / 100).astype( np.float32 ), (p[:, 2:3] / 100).astype( np.float32 )
+    ambush_hours = np.zeros( (num_areas, REST_HOURS), dtype=np.int64 )
+    batch = max( 1, chunk // max( num_areas, 1 ) )
+    for done in range( 0, rests, batch ):
+        n = min( batch, rests - done )
+        start = rng.integers( 0, 24, n, dtype=np.uint8 ) # hour of day only decides day/night, so rests in a batch share start hours across areas
+        waiting = np.ones( (num_areas, n), dtype=bool )
+        for h in range( REST_HOURS ):
+            is_day = day[ (start + h) % 24 ]
+            hit = rng.random( (num_areas, n), dtype=np.float32 ) < np.where( is_day, chance_day, chance_night )
+            hit &= waiting
+            ambush_hours[:, h] += np.count_nonzero( hit, axis=1 )
+            waiting ^= hit
+    ambushes = ambush_hours.sum( axis=1 )
+
+    # creature mix: every spawned creature picks a uniform slot, so the slot counts of all ambushes are one multinomial draw per area
+    spawns = np.clip( party_levels // np.maximum( difficulty, 1 ), 1, np.maximum( p[:, 0], 1 ) ).astype( np.int64 )
+    slot_picks = rng.multinomial( ambushes * spawns, np.full( num_slots, 1 / num_slots ) ) if num_areas else np.zeros( (0, num_slots), dtype=np.int64 )
+
+    # power of single encounters, sampled, in blocks of areas to bound memory
+    slot_power = np.where( slots >= 0, power[ np.maximum( slots, 0 ) ] if len( power ) else 0, 0 ).astype( np.float64 )
+    encounter_power = np.zeros( (num_areas, power_samples) )
+    most = int( spawns.max() ) if num_areas else 0
+    block = max( 1, chunk // max( power_samples * most, 1 ) )
+    for a in range( 0, num_areas, block ):
+        b = min( a + block, num_areas )
+        picks = rng.integers( 0, num_slots, (b - a, power_samples * most) )
+        picked = np.take_along_axis( slot_power[a:b], picks, axis=1 ).reshape( b - a, power_samples, most )
+        picked *= np.arange( most ) < spawns[a:b, None, None]
+        encounter_power[a:b] = picked.sum( axis=2 )
+    return { 'ambushes': ambushes, 'ambush_hours': ambush_hours, 'spawns': spawns, 'slot_picks': slot_picks, 'encounter_power': encounter_power }
+def expected_ambush_rate( params ):
+    '''Exact chance of at least one ambush per rest under the same model, [A]'''
+    p = np.array( params, dtype=np.float64 ).reshape( -1, 3 ) / 100
+    day = np.isin( np.arange( 24 ), list( DAY_HOURS ) )
+    hours = (np.arange( 24 )[:, None] + np.arange( REST_HOURS )) % 24 # [start, h]
+    quiet = np.where( day[ hours ][None], 1 - p[:, 1, None, None], 1 - p[:, 2, None, None] ).prod( axis=2 ) # [A, start]
+    return 1 - quiet.mean( axis=1 )
+def summarize( areas, slots, creatures, params, sim, rests ):
+    '''Map AreaName -> { ambush_rate, ambush_rate_expected, mean_ambush_hour, spawns, empty_share, mix: Map CreatureName -> share, power: {mean std p10 p50 p90} }'''
+    expected = expected_ambush_rate( params )
+    percentiles = np.percentile( sim['encounter_power'], [10, 50, 90], axis=1 ) if len( areas ) else np.zeros( (3, 0) )
+    report = {}
+    for i, area in enumerate( areas ):
+        picks = sim['slot_picks'][i]
+        total = int( picks.sum() )
+        mix = {}
+        for row, count in zip( slots[i].tolist(), picks.tolist() ):
+            name = creatures.names[ row ] if row >= 0 else '*'
+            mix[ name ] = mix.get( name, 0 ) + count
+        hours = sim['ambush_hours'][i]
+        report[ area ] = {
+            'ambush_rate': sim['ambushes'][i] / rests,
+            'ambush_rate_expected': float( expected[i] ),
+            'mean_ambush_hour': float( (hours * np.arange( REST_HOURS )).sum() / max( hours.sum(), 1 ) ),
+            'spawns': int( sim['spawns'][i] ),
+            'empty_share': mix.get( '*', 0 ) / total if total else 0.0,
+            'mix': { name: count / total for name, count in sorted( mix.items(), key=lambda kv: -kv[1] ) if name != '*' } if total else {},
+            'power': { 'mean': float( sim['encounter_power'][i].mean() ), 'std': float( sim['encounter_power'][i].std() ),
+                       'p10': float( percentiles[0][i] ), 'p50': float( percentiles[1][i] ), 'p90': float( percentiles[2][i] ) },
+        }
+    return report
+def run( path_groups, path_actors, dir_are = None, rests = 100_000, party_levels = 60, seed = 1 ):
+    groups = sg.load_2da( path_groups )
+    _, creatures = sg.load_actors( path_actors )
+    areas, slots, difficulty = group_arrays( groups, creatures )
+    by_area = rest_params( areas, dir_are )
+    params = [ by_area[ area ] for area in areas ]
+    t = perf_counter()
+    sim = simulate( slots, difficulty, params, creatures.power(), rests, party_levels, seed=seed )
+    seconds = perf_counter() - t
+    return { 'meta': { 'areas': len( areas ), 'rests_per_area': rests, 'party_levels': party_levels, 'seed': seed, 'seconds': seconds },
+             'areas': summarize( areas, slots, creatures, params, sim, rests ) }
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser( description='Simulate rest ambushes for every RD<area> spawn group' )
+    parser.add_argument( '--groups', default=sg.path_output, help='generated SPAWNGRP.2da' )
+    parser.add_argument( '--actors', default='bin/actor_stats.json' )
+    parser.add_argument( '--are', help='directory of patched <area>.ARE files for max_creature_spawns and spawn probabilities' )
+    parser.add_argument( '--rests', type=int, default=100_000, help='rests per area' )
+    parser.add_argument( '--party-levels', type=int, default=60, help='sum of party levels' )
+    parser.add_argument( '--seed', type=int, default=1 )
+    parser.add_argument( '--out', default='bin/restsim.json' )
+    args = parser.parse_args()
+
+    report = run( args.groups, args.actors, args.are, args.rests, args.party_levels, args.seed )
+    with open( args.out, 'w' ) as f:
+        json.dump( report, f, indent=1 )
+    meta = report['meta']
+    print( f"{meta['areas']} areas x {meta['rests_per_area']} rests in {meta['seconds']:.2f} s" )
+    print( f"{'area':8} {'ambush':>7} {'exact':>7} {'spawns':>6} {'power p10/p50/p90':>20}  top creature" )
+    for area, r in report['areas'].items():
+        top = next( iter( r['mix'].items() ), ('-', 0) )
+        pw = r['power']
+        print( f"{area:8} {r['ambush_rate']:7.3f} {r['ambush_rate_expected']:7.3f} {r['spawns']:6} {pw['p10']:6.0f}/{pw['p50']:6.0f}/{pw['p90']:6.0f}  {top[0]} {top[1]:.0%}" )
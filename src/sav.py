@@ -0,0 +1,110 @@
+from   concurrent.futures import ProcessPoolExecutor
+import struct
+import zlib
+
+from   fileio import write_atomic
+import zsearch
+
+# BALDUR.SAV: 'SAV V1.0' then entries of { u32 len_filename (incl null), filename, u32 len_uncompressed, u32 len_compressed, zlib data }. Mirrors SAV_* in main.odin
+SAV_SIGNATURE = b'SAV V1.0'
+U32 = struct.Struct( '<I' )
+LENGTHS = struct.Struct( '<II' ) # len_uncompressed, len_compressed
+
+def decompress( blob, chunk_size = 1 << 16 ):
+    '''Inflate a zlib stream incrementally, feeding it chunk_size bytes at a time'''
+    d = zlib.decompressobj()
+    parts = []
+    for i in range( 0, len( blob ), chunk_size ):
+        parts.append( d.decompress( blob[ i : i + chunk_size ] ) )
+    parts.append( d.flush() )
+    return b''.join( parts )
+
+class SavEntry:
+    __slots__ = ('name', 'len_uncompressed', 'compressed', 'original', 'data', 'modified')
+    def __init__( self, name, len_uncompressed, compressed ):
+        self.name = name # without null terminator
+        self.len_uncompressed = len_uncompressed
+        self.compressed = compressed # zlib stream as it will be written; None while modified
+        self.original = compressed # stream as read, kept to recompress with the parameters that produced it (see zsearch)
+        self.data = None # decompressed on first access
+        self.modified = False
+
+class Sav:
+    '''SAV container. Entries are read one at a time, inflated lazily on access, and untouched entries are written back with their original zlib stream'''
+    def __init__( self, path ):
+        self.entries = {} # :: Map FileName -> SavEntry, in file order
+        with open( path, 'rb' ) as f:
+            assert f.read( 8 ) == SAV_SIGNATURE, "Unexpected signature"
+            while True:
+                head = f.read( 4 )
+                if len( head ) < 4: break
+                len_filename, = U32.unpack( head )
+                name = f.read( len_filename )[:-1].decode( 'latin-1' ) # drop null terminator
+                len_uncompressed, len_compressed = LENGTHS.unpack( f.read( 8 ) )
+                self.entries[ name ] = SavEntry( name, len_uncompressed, f.read( len_compressed ) )
+            if head: print( f"Warning: SAV has {len( head )} bytes remaining at the end" )
+    def __len__( self ): return len( self.entries )
+    def __contains__( self, name ): return name in self.entries
+    def __iter__( self ): return iter( self.entries )
+    def __getitem__( self, name ):
+        entry = self.entries[ name ]
+        if entry.data is None:
+            entry.data = decompress( entry.compressed )
+            assert len( entry.data ) == entry.len_uncompressed, f"{name}: inflated to {len( entry.data )} b, expected {entry.len_uncompressed}"
+        return entry.data
+    def __setitem__( self, name, data ):
+        '''Replace (or add) an entry; it is recompressed on save'''
+        entry = self.entries.get( name )
+        if entry is None:
+            entry = self.entries[ name ] = SavEntry( name, 0, None )
+        elif not entry.modified and self[ name ] == data: # inflates on first access; identical data keeps the original stream
+            return
+        entry.data = bytes( data )
+        entry.len_uncompressed = len( entry.data )
+        entry.compressed = None
+        entry.modified = True
+    def modified( self ):
+        return [ e for e in self.entries.values() if e.modified ]
+    def iter_chunks( self ):
+        '''The serialized SAV, piece by piece; every entry must be compressed'''
+        yield SAV_SIGNATURE
+        for entry in self.entries.values():
+            name = entry.name.encode( 'latin-1' ) + b'\0'
+            yield U32.pack( len( name ) )
+            yield name
+            yield LENGTHS.pack( entry.len_uncompressed, len( entry.compressed ) )
+            yield entry.compressed
+    def save( self, path, workers = None, zparams = None ):
+        '''Write the SAV, recompressing only modified entries (in a process pool when there is more than one) with the zlib parameters
+        zsearch found for their original streams. zparams: a zsearch cache, loaded from zsearch.PATH_CACHE if None'''
+        dirty = self.modified()
+        if zparams is None: zparams = zsearch.load_cache() if dirty else {}
+        args = ([ e.data for e in dirty ], [ e.original for e in dirty ], [ zparams ] * len( dirty ))
+        if len( dirty ) > 1 and workers != 0:
+            with ProcessPoolExecutor( workers ) as pool:
+                blobs = list( pool.map( zsearch.recompress, *args ) )
+        else:
+            blobs = list( map( zsearch.recompress, *args ) )
+        for entry, blob in zip( dirty, blobs ):
+            entry.compressed = blob
+            entry.modified = False
+
+        write_atomic( path, self.iter_chunks() )
+        return len( dirty )
+
+if __name__ == '__main__':
+    import os
+    import tempfile
+    from   time import perf_counter
+    path = 'bin/game/save/BALDUR.SAV'
+    t0 = perf_counter()
+    sav = Sav( path )
+    t1 = perf_counter()
+    for name in list( sav )[:3]:
+        sav[ name ] = sav[ name ][:-1] + b'\0' # touch a few areas
+    fd, path_out = tempfile.mkstemp( suffix='.sav' )
+    os.close( fd )
+    sav.save( path_out )
+    t2 = perf_counter()
+    os.unlink( path_out )
+    print( f'{len( sav )} entries: read {1e3*(t1-t0):.2f} ms, patched and saved {1e3*(t2-t1):.2f} ms' )
@@ -1,9 +1,8 @@
 if 0:
+    from key import Key, RESType
     PATH_BASE_GAME = 'bin/game'
-    path = f'{PATH_BASE_GAME}/chitin.key'
-    buf = open( path, 'rb' ).read()
-    sig = buf[0:4]
-    print( sig )
+    with Key( f'{PATH_BASE_GAME}/chitin.key' ) as key:
+        print( len( key.bifs ), len( key ), key.lookup( 'AR1200', RESType.ARE ) )
 
 import zlib
 
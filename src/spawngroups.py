@@ -1,14 +1,41 @@
-from   collections import Counter
+from   array import array
+from   bisect import bisect_left
+from   collections import Counter, OrderedDict
+from   concurrent.futures import ProcessPoolExecutor
+from   contextlib import contextmanager
+import cProfile
+import hashlib
+import heapq
+import io
 import json
 from   math import floor
+import mmap
+import numpy as np
+import os
+import pstats
+import sys
+import time
+from   time import perf_counter
+import tracemalloc
+try:
+    import resource # not on Windows
+except ImportError:
+    resource = None
 
-#TODO figure out SpawnGroup Difficulty
+import are
+from   bif import BifCache
+from   fileio import write_atomic, write_if_changed
+from   key import Key
+
+#TODO tune DIFFICULTY_PER_POWER
 #TODO flesh out manual data
 
 PATH_GAME_BASE = r'D:\games\Infinity Engine\Icewind Dale Enhanced Edition'
 path_pristine = PATH_GAME_BASE + '/override.pristine/SPAWNGRP.2da'
 path_output = PATH_GAME_BASE + '/override/SPAWNGRP.2da'
+path_cache = 'bin/spawngroups_cache.json'
 DEFAULT_DIFFICULTY = 10 # 10=25/15, 20=15/15, 30=9/15, 40=8/15, 50=9/15, 70=1/15
+DIFFICULTY_PER_POWER = 1.0 # spawn group difficulty = mean slot power * this; None to use DEFAULT_DIFFICULTY everywhere
 manual = '''
 #AR1200 100 ORCWAXE ORCWBOW ORCEWAXE ORCSHAM OGRE * * *
 #AR1200 100 ORCWAXE ORCWBOW ORCEWAXE ORCSHAM OGRE * * *
@@ -353,6 +380,107 @@ def compute_spawner_slots_with_guarantees_steal_by_ratio( enemy_list, num_slots=
     slot_list = slot_list[:num_slots]
 
     return slot_list
+def compute_spawner_slots_heap( enemy_list, num_slots = 8 ):
+    '''Drop-in for compute_spawner_slots_with_guarantees_steal_by_ratio that is exact for any num_slots.
+    Drops the least frequent enemies (same order as the steal_* variants) until at most num_slots remain, then picks the
+    allocation with every remaining enemy >= 1 slot that minimizes sum( (slots - ideal)^2 ), ideal = count/total * num_slots.
+    Starts from max( 1, floor(ideal) ) and moves one slot at a time to/from the enemy with the cheapest marginal error via a heap;
+    fewer than k moves are needed, so O(k log k) for k distinct enemies'''
+    if not enemy_list: return ['*'] * num_slots
+
+    counts = Counter( enemy_list )
+    enemies = list( counts.keys() )
+    if len( enemies ) > num_slots:
+        dropped = set( sorted( enemies, key=lambda e: counts[e] )[ :len( enemies ) - num_slots ] )
+        enemies = [ e for e in enemies if e not in dropped ]
+    if not enemies: return ['*'] * num_slots
+
+    total = sum( counts[e] for e in enemies )
+    ideal = [ counts[e] / total * num_slots for e in enemies ]
+    alloc = [ max( 1, floor( q ) ) for q in ideal ]
+    leftover = num_slots - sum( alloc )
+
+    # marginal error of +1 slot is 2*(a - q) + 1, of -1 slot is 2*(q - a) + 1; ties go to the first-seen enemy
+    if leftover > 0:
+        heap = [ (a - q, i) for i, (a, q) in enumerate( zip( alloc, ideal ) ) ]
+        heapq.heapify( heap )
+        for _ in range( leftover ):
+            _, i = heapq.heappop( heap )
+            alloc[i] += 1
+            heapq.heappush( heap, (alloc[i] - ideal[i], i) )
+    elif leftover < 0:
+        heap = [ (q - a, i) for i, (a, q) in enumerate( zip( alloc, ideal ) ) if a > 1 ]
+        heapq.heapify( heap )
+        for _ in range( -leftover ):
+            _, i = heapq.heappop( heap )
+            alloc[i] -= 1
+            if alloc[i] > 1: heapq.heappush( heap, (ideal[i] - alloc[i], i) )
+
+    slots = []
+    for e, a in zip( enemies, alloc ):
+        slots.extend( [e] * a )
+    return slots
+def build_count_matrix( enemy_lists ):
+    '''Pack many enemy lists into one padded (areas x distinct enemies) count matrix.
+    Columns of each row are in first-seen order (same as Counter), unused columns are 0.
+    Returns (counts, names) where names[row] lists the enemy for each used column'''
+    names = [] # :: [][]CreatureName
+    rows = [] # :: [][]int
+    for enemy_list in enemy_lists:
+        counts = Counter( enemy_list )
+        names.append( list( counts.keys() ) )
+        rows.append( list( counts.values() ) )
+    width = max( [ len( r ) for r in rows ], default=0 )
+    matrix = np.zeros( (len( rows ), max( width, 1 )), dtype=np.int64 )
+    for y, row in enumerate( rows ):
+        matrix[ y, :len( row ) ] = row
+    return matrix, names
+def compute_spawner_slots_batch( counts, names, num_slots = 8 ):
+    '''Vectorized compute_spawner_slots_with_guarantees_steal_by_ratio over every row of a count matrix at once.
+    See build_count_matrix for the input layout. Returns a list of slot lists, identical to the scalar version'''
+    counts = np.array( counts, dtype=np.int64 ) # copy, we zero out dropped enemies
+    nrows, ncols = counts.shape
+    cols = np.arange( ncols )
+
+    # drop least frequent if too many distinct; stable sort so ties keep first-seen order like list.sort
+    valid = counts > 0
+    excess = valid.sum( axis=1 ) - num_slots
+    if (excess > 0).any():
+        key = np.where( valid, counts, np.iinfo( np.int64 ).max )
+        rank = np.argsort( np.argsort( key, axis=1, kind='stable' ), axis=1, kind='stable' )
+        counts[ valid & (rank < excess[:, None]) ] = 0
+        valid = counts > 0
+
+    # ideal fraction, floor, and largest remainder for leftover slots
+    total = counts.sum( axis=1, keepdims=True )
+    ideal = counts / np.maximum( total, 1 ) * num_slots
+    final = np.floor( ideal )
+    leftover = num_slots - final.sum( axis=1 )
+    key = np.where( valid, -(ideal - final), np.inf )
+    rank = np.argsort( np.argsort( key, axis=1, kind='stable' ), axis=1, kind='stable' )
+    final = final.astype( np.int64 ) + (valid & (rank < leftover[:, None]))
+
+    # steal for zero-slot enemies, one zero per row per round in first-seen order
+    rows = np.arange( nrows )
+    for _ in range( num_slots ):
+        zero = valid & (final == 0)
+        donors = final > 1
+        active = zero.any( axis=1 ) & donors.any( axis=1 )
+        if not active.any(): break
+        z = np.where( zero, cols, ncols ).argmin( axis=1 )
+        donor = np.where( donors, final - ideal, -np.inf ).argmax( axis=1 )
+        final[ rows[active], donor[active] ] -= 1
+        final[ rows[active], z[active] ] = 1
+
+    # build slot lists
+    results = []
+    for y in range( nrows ):
+        slots = []
+        for enemy, n in zip( names[y], final[y].tolist() ):
+            slots.extend( [enemy] * n )
+        slots.extend( ['*'] * (num_slots - len( slots )) )
+        results.append( slots[:num_slots] )
+    return results
 def sortby_group( xs ):
     """
     Return a new list in which enemies are grouped by descending frequency.
@@ -379,135 +507,791 @@ def test_gippity_math():
     for method in [ compute_spawner_slots, compute_spawner_slots_with_guarantees_jank_ratio, compute_spawner_slots_with_guarantees_steal_from_rich, compute_spawner_slots_with_guarantees_steal_by_ratio ]:
         #print( method.__name__ )
         print( sortby_group(method( designer_list, 8 )) )
+def test_heap_optimal( trials = 300, seed = 1 ):
+    '''compute_spawner_slots_heap must reach the brute-force minimum squared error with the min-one guarantee'''
+    from   itertools import product
+    import random
+    rng = random.Random( seed )
+    for _ in range( trials ):
+        num_slots = rng.randint( 1, 9 )
+        kinds = [ f'MOB{i}' for i in range( rng.randint( 1, min( num_slots, 5 ) ) ) ]
+        enemy_list = kinds + [ rng.choice( kinds ) for _ in range( rng.randint( 0, 40 ) ) ]
+        counts = Counter( enemy_list )
+        ideal = [ c / len( enemy_list ) * num_slots for c in counts.values() ]
+        error = lambda alloc: sum( (a - q) ** 2 for a, q in zip( alloc, ideal ) )
+        best = min( error( alloc ) for alloc in product( range( 1, num_slots + 1 ), repeat=len( kinds ) ) if sum( alloc ) == num_slots )
+        slots = compute_spawner_slots_heap( enemy_list, num_slots )
+        assert len( slots ) == num_slots and '*' not in slots
+        assert abs( error( [ slots.count( e ) for e in counts ] ) - best ) < 1e-9, f'{enemy_list} {num_slots} -> {slots}'
+def test_batch_parity( trials = 2000, seed = 1 ):
+    '''compute_spawner_slots_batch must match compute_spawner_slots_with_guarantees_steal_by_ratio exactly'''
+    import random
+    rng = random.Random( seed )
+    pool = [ f'MOB{i}' for i in range( 24 ) ]
+    enemy_lists = [ [], ['Solo'] ]
+    for _ in range( trials ):
+        kinds = rng.sample( pool, rng.randint( 1, 16 ) )
+        enemy_lists.append( [ rng.choice( kinds ) for _ in range( rng.randint( 1, 60 ) ) ] )
+    for num_slots in [ 8, 4, 16 ]:
+        counts, names = build_count_matrix( enemy_lists )
+        batch = compute_spawner_slots_batch( counts, names, num_slots )
+        for enemy_list, slots in zip( enemy_lists, batch ):
+            expected = compute_spawner_slots_with_guarantees_steal_by_ratio( enemy_list, num_slots )
+            assert slots == expected, f'{enemy_list} -> {slots} != {expected}'
 
 # Load/Save
+class Table2DA:
+    '''Column-oriented 2DA table. Column 0 (named '') holds the row labels, every other column is named by the header row.
+    For SPAWNGRP.2da each column is a spawn group: [difficulty, creature slots...]
+    Unmodified tables serialize back to their source text byte-for-byte'''
+    def __init__( self, header = ('2DA V1.0', '0'), row_labels = () ):
+        self.header = list( header ) # signature line, default value line
+        self.names = [''] # :: [ColumnIndex]ColumnName
+        self.index = { '': 0 } # :: Map ColumnName -> ColumnIndex
+        self.columns = [ list( row_labels ) ] # :: [ColumnIndex][Row]Value
+        self.source = None # original text; cleared once modified
+    @classmethod
+    def loads( cls, text ):
+        lines = text.splitlines()
+        table = cls( lines[0:2] )
+        default = lines[1].strip()
+        names = lines[2].split()
+        width = len( names ) + 1
+        rows = [ line.split() for line in lines[3:] if line.strip() ]
+        for row in rows:
+            if len( row ) < width: row.extend( [default] * (width - len( row )) )
+        table.names = [''] + names
+        table.index = { name: x for x, name in enumerate( table.names ) }
+        table.columns = [ list( col ) for col in zip( *rows ) ] if rows else [ [] for _ in table.names ]
+        del table.columns[ width: ] # ignore stray trailing values
+        table.source = text
+        return table
+    def __len__( self ): return len( self.names )
+    def __contains__( self, name ): return name in self.index
+    def __getitem__( self, name ): return self.columns[ self.index[ name ] ]
+    @property
+    def nrows( self ): return len( self.columns[0] )
+    def copy( self ):
+        '''Independent table sharing cell lists until they are replaced (set_column never mutates a column in place)'''
+        table = Table2DA( self.header )
+        table.names = self.names[:]
+        table.index = dict( self.index )
+        table.columns = self.columns[:]
+        table.source = self.source
+        return table
+    def set_column( self, name, values ):
+        '''Add or replace column name'''
+        values = list( values )
+        if len( values ) != self.nrows: raise ValueError( f"Column {name} has {len( values )} rows, expected {self.nrows}" )
+        x = self.index.get( name )
+        if x is None:
+            self.index[ name ] = len( self.names )
+            self.names.append( name )
+            self.columns.append( values )
+        elif self.columns[x] != values:
+            self.columns[x] = values
+        else:
+            return
+        self.source = None
+    def dumps( self, SIZE = 10 ):
+        if self.source is not None: return self.source
+        lines = self.header[:]
+        lines.append( '\t'.join( [ name.ljust( SIZE ) for name in self.names ] ) )
+        for row in zip( *self.columns ):
+            lines.append( '\t'.join( [ value.ljust( SIZE ) for value in row ] ) )
+        lines.append( '' )
+        return '\n'.join( lines )
 def load_2da( path ):
-    buf = open( path ).read()
-    lines = buf.split( '\n' )
-    header = lines[0:2]
-
-    groups = {} # Map ColumnIndex -> { name, diff, [creatures] }
-
-    for y, line in enumerate( lines[2:] ):
-        if y == 0: line = 'dummy ' + line
-        for x, col in enumerate( line.split() ):
-            if y == 0: # spawn group name
-                groups[x] = { 'name': col, 'diff': 'dummy', 'creatures': [] }
-            elif y == 1: # difficulty row
-                groups[x]['diff'] = col
-            elif y > 1: # creature slots
-                groups[x]['creatures'].append( col )
-    groups[0]['name'] = ''
-
-    for group in groups.values():
-        assert len( group['creatures'] ) == 8
-    return groups
-def save_2da( path, groups, SIZE = 10 ):
-    s = '2DA V1.0\n0\n'
-    s += '\t'.join( [ f"{g['name'] :{SIZE}}" for g in groups.values() ] ) + '\n'
-    s += '\t'.join( [ f"{g['diff'] :{SIZE}}" for g in groups.values() ] ) + '\n'
-    for slot in range( 8 ):
-        s += '\t'.join( [ f"{g['creatures'][slot] :{SIZE}}" for g in groups.values() ] ) + '\n'
-    open( path, 'w' ).write( s )
+    with open( path, newline='' ) as f:
+        return Table2DA.loads( f.read() )
+def save_2da( path, table ):
+    return write_if_changed( path, table.dumps() )
+def test_2da_roundtrip():
+    text = '2DA V1.0\r\n*\r\n      GROUPA   GROUPB\r\ndiff  10 20\r\n1 ORC1 GOB1\r\n2  ORC2\r\n'
+    table = Table2DA.loads( text )
+    assert table.dumps() == text
+    assert table['GROUPB'] == ['20', 'GOB1', '*']
+    table.set_column( 'GROUPA', table['GROUPA'] )
+    assert table.dumps() == text
+    table.set_column( 'RDAR1200', ['10', 'ORC3', '*'] )
+    assert Table2DA.loads( table.dumps() )['RDAR1200'] == ['10', 'ORC3', '*']
+def bench_2da( ncols = 10_000, nslots = 8 ):
+    names = [ f'G{x:05d}' for x in range( ncols ) ]
+    lines = [ '2DA V1.0', '0', ' ' * 10 + '\t'.join( names ), 'diff\t' + '\t'.join( ['10'] * ncols ) ]
+    for slot in range( nslots ):
+        lines.append( f'{slot+1}\t' + '\t'.join( [ f'CRE{(x*7+slot) % 997:05d}' for x in range( ncols ) ] ) )
+    text = '\n'.join( lines ) + '\n'
 
-# Calculate area groups
-def uniques( es ):
-    seen = set()
-    xs = []
-    for e in es:
-        elower = e.lower()
-        if elower not in seen:
-            seen.add( elower )
-            xs.append( e )
-    return xs
-def nuniques( es ): return len( uniques( es ) )
-def normalize_to_first( items ):
-    normalized_map = {}  # Maps lowercase version to the first actual-cased version seen
-    result = []
-    for element in items:
-        key = element.lower()
-        if key not in normalized_map:
-            # First time we see this (case-insensitive) string, store its original casing
-            normalized_map[key] = element
-        # Use the first casing we encountered
-        result.append(normalized_map[key])
-    return result
-def update_groups( groups ):
-    data = json.loads( open( 'bin/actor_stats.json' ).read() )
+    t0 = perf_counter()
+    table = Table2DA.loads( text )
+    t1 = perf_counter()
+    for x in range( 0, ncols, 10 ):
+        table.set_column( f'RDAR{x:05d}', ['20'] + ['*'] * nslots )
+    t2 = perf_counter()
+    out = table.dumps()
+    t3 = perf_counter()
+    print( f'2DA {ncols} cols ({len( text )} b): load {1e3*(t1-t0):.1f} ms, {ncols // 10} set_column {1e3*(t2-t1):.1f} ms, dump {1e3*(t3-t2):.1f} ms ({len( out )} b)' )
 
-    # find all _reasonable_ enemies for the area, duplicates according to frequency
-    areas = {} # :: Map AreaName -> [?]CreatureName
-    creatures = {} # :: Map CreatureName -> [ActorStats]
-    spawns = {} # :: Map AreaName -> [8]CreatureName
-    difficulty = {} # :: Map AreaName -> Diff
+# Calculate area groups
+class PrefixIndex:
+    '''Sorted-name index over areas for neighbor filling. Built once, never mutates the input counters.
+    merged( prefix ) returns the summed hostile mob counts of every area whose name starts with prefix, in area insertion order'''
+    def __init__( self, areas ):
+        self.areas = areas # :: Map AreaName -> Counter[CreatureId]
+        self.order = { name: i for i, name in enumerate( areas ) } # :: Map AreaName -> insertion index
+        self.names = sorted( areas )
+        self.cache = {} # :: Map Prefix -> Counter[CreatureId]
+    def neighbors( self, prefix ):
+        lo = bisect_left( self.names, prefix )
+        hi = lo
+        while hi < len( self.names ) and self.names[hi].startswith( prefix ): hi += 1
+        return sorted( self.names[lo:hi], key=self.order.__getitem__ )
+    def merged( self, prefix ):
+        if prefix not in self.cache:
+            mobs = Counter()
+            for neighbor in self.neighbors( prefix ):
+                mobs.update( self.areas[ neighbor ] )
+            self.cache[ prefix ] = mobs
+        return self.cache[ prefix ]
 
-    for actor in data:
+# Ingest actor stats
+def iter_json_values( f, chunk_size = 1 << 16 ):
+    '''Yield the elements of a top-level JSON array of objects (or each object of NDJSON) while reading f in chunks'''
+    decoder = json.JSONDecoder()
+    buf, pos, eof = '', 0, False
+    in_array = None # unknown until the first non-whitespace char
+    while True:
+        while pos < len( buf ) and buf[pos] in ' \t\r\n,': pos += 1
+        if pos < len( buf ) and in_array is None:
+            in_array = buf[pos] == '['
+            if in_array: pos += 1
+            continue
+        if pos < len( buf ) and in_array and buf[pos] == ']': return
+        if pos == len( buf ):
+            if eof: return
+            buf, pos = f.read( chunk_size ), 0
+            eof = not buf
+            continue
+        try:
+            value, end = decoder.raw_decode( buf, pos )
+        except json.JSONDecodeError:
+            if eof: raise
+            end = None
+        if end is None or (end == len( buf ) and not eof): # a number (or literal) ending at the chunk boundary may continue in the next chunk
+            chunk = f.read( chunk_size )
+            eof = not chunk
+            buf, pos = buf[pos:] + chunk, 0
+            continue
+        yield value
+        pos = end
+def test_iter_json_values():
+    for chunk_size in [1, 2, 3, 5, 1 << 16]:
+        assert list( iter_json_values( io.StringIO( '[12345, 678, true, {"a": [1, 2]}]' ), chunk_size ) ) == [12345, 678, True, { 'a': [1, 2] }]
+        assert list( iter_json_values( io.StringIO( '{"a": 1}\n{"b": 22}\n' ), chunk_size ) ) == [{ 'a': 1 }, { 'b': 22 }]
+def iter_actors( path ):
+    with open( path ) as f:
+        yield from iter_json_values( f )
+class CreatureTable:
+    '''Columnar CRE stats, one row per case-insensitively distinct creature resref, named by its first-seen casing.
+    Rows double as the interned creature ids (CreatureId) used for per-area counts'''
+    def __init__( self ):
+        self.index = {} # :: Map lowercase CreatureName -> row
+        self.names = [] # :: [row]CreatureName
+        self.found_cre_file = array( 'B' )
+        self.hostile = array( 'B' )
+        self.allegience = array( 'B' ) # EnemyAlly
+        self.hp_max = array( 'H' )
+        self.power_level = array( 'I' )
+        self.class_levels = array( 'B' ) # 3 per row
+        self._power = None # see power()
+    def __len__( self ): return len( self.names )
+    def __contains__( self, name ): return name.lower() in self.index
+    def row( self, name ): return self.index[ name.lower() ]
+    def add( self, actor ):
+        '''Add the creature of actor if not already present. Returns its row'''
+        name = actor['creature_file']
+        key = name.lower()
+        row = self.index.get( key )
+        if row is None:
+            row = self.index[ sys.intern( key ) ] = len( self.names )
+            self.names.append( sys.intern( name ) )
+            self.found_cre_file.append( actor['found_cre_file'] )
+            self.hostile.append( actor['hostile'] )
+            self.allegience.append( actor['allegience'] )
+            self.hp_max.append( actor['hp_max'] )
+            self.power_level.append( actor['power_level'] )
+            self.class_levels.extend( actor['class_levels'] )
+        elif actor['found_cre_file'] and not self.found_cre_file[ row ]: # another casing resolved to a real CRE; prefer its stats
+            self._power = None
+            self.found_cre_file[ row ] = 1
+            self.hostile[ row ] = actor['hostile']
+            self.allegience[ row ] = actor['allegience']
+            self.hp_max[ row ] = actor['hp_max']
+            self.power_level[ row ] = actor['power_level']
+            self.class_levels[ 3*row : 3*row+3 ] = array( 'B', actor['class_levels'] )
+        return row
+    def power( self ):
+        '''[row]power = max( max class level, power_level, hp_max/8 ); 0 for unknown CREs. Computed once, then cached'''
+        if self._power is None or len( self._power ) != len( self ):
+            column = lambda a: np.frombuffer( a, dtype=f'u{a.itemsize}' )
+            levels = column( self.class_levels ).reshape( -1, 3 ).max( axis=1, initial=0 )
+            plvl = column( self.power_level )
+            hp = column( self.hp_max )
+            self._power = np.maximum( np.maximum( levels, plvl ), hp / 8 )
+        return self._power
+def ingest_actors( actors ):
+    '''Fold a stream of actor stats into per-area hostile counts and a CreatureTable without keeping the actors'''
+    areas = {} # :: Map AreaName -> Counter[CreatureId]
+    creatures = CreatureTable()
+    for actor in actors:
         area_name = actor['area']
-        actor_name = actor['creature_file']
         hostile = actor['hostile']
         if not actor['found_cre_file']: hostile = True # assume hostile if no CRE file
 
-        if actor_name not in creatures: creatures[ actor_name ] = []
-        creatures[ actor_name ].append( actor )
+        row = creatures.add( actor )
 
-        if area_name not in areas: areas[ area_name ] = [] # make sure to create spawn for every area
+        if area_name not in areas: areas[ sys.intern( area_name ) ] = Counter() # make sure to create spawn for every area
 
         if not hostile: continue
-        areas[ area_name ].append( actor_name )
+        areas[ area_name ][ row ] += 1
+    return areas, creatures
+# Instrumentation
+class Stats:
+    '''Wall time and peak memory per pipeline stage plus named counters for one run.
+    Peak memory is exact (tracemalloc, per stage) with trace_memory, else the process max RSS; cprofile profiles the whole run'''
+    def __init__( self, trace_memory = False, cprofile = False ):
+        self.stages = {} # :: Map StageName -> { seconds, calls, peak_bytes | max_rss_kb }
+        self.counters = Counter()
+        self.trace_memory = trace_memory
+        self.profiler = cProfile.Profile() if cprofile else None
+        self.started_tracing = False
+    def __enter__( self ):
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self.started_tracing = True
+        if self.profiler: self.profiler.enable()
+        return self
+    def __exit__( self, *exc ):
+        if self.profiler: self.profiler.disable()
+        if self.started_tracing:
+            tracemalloc.stop()
+            self.started_tracing = False
+    @contextmanager
+    def stage( self, name ):
+        if self.trace_memory and tracemalloc.is_tracing(): tracemalloc.reset_peak()
+        t = perf_counter()
+        try:
+            yield
+        finally:
+            entry = self.stages.setdefault( name, { 'seconds': 0.0, 'calls': 0 } )
+            entry['seconds'] += perf_counter() - t
+            entry['calls'] += 1
+            if self.trace_memory and tracemalloc.is_tracing():
+                entry['peak_bytes'] = max( entry.get( 'peak_bytes', 0 ), tracemalloc.get_traced_memory()[1] )
+            elif resource:
+                entry['max_rss_kb'] = resource.getrusage( resource.RUSAGE_SELF ).ru_maxrss
+    def count( self, name, n = 1 ):
+        self.counters[ name ] += n
+    def warn( self, message ):
+        self.counters['warnings'] += 1
+        print( message )
+    def report( self, top = 25 ):
+        report = { 'stages': self.stages, 'counters': dict( self.counters ) }
+        if self.profiler:
+            out = io.StringIO()
+            pstats.Stats( self.profiler, stream=out ).sort_stats( 'cumulative' ).print_stats( top )
+            report['cprofile'] = out.getvalue()
+        return report
 
-    # calculate slots for each area based on frequency analysis
-    for area in areas:
-        mobs = areas[ area ]
-
-        neighbor_distance = 0
-        while nuniques( mobs ) < 4:
-            if nuniques( mobs ) == 0: break # probably a non-hostile area
-            neighbor_distance += 1
-            name_prefix = area[:-neighbor_distance]
-            print( f"Warning: Area {area} has only {nuniques( mobs )} enemies {uniques( mobs )}. Filling with {name_prefix}*" )
-            for neighbor in areas:
-                if neighbor.startswith( name_prefix ):
-                    mobs.extend( areas[ neighbor ] )
-
-        spawns[ area ] = compute_spawner_slots_with_guarantees_steal_by_ratio( normalize_to_first(mobs), 8 )
-    
-    # override with manual data when possible
-    for line in manual.split( '\n' ):
-        if not line.split('#')[0]: continue
-        area, diff, *creatures = line.split()
+# Incremental rebuild cache
+CACHE_VERSION = 2 # bump whenever slot allocation changes
+def area_key( mobs, num_slots, manual_line ):
+    '''Content hash of everything an area's slots depend on: its neighbor-filled hostile counts (in order), num_slots, and its manual line'''
+    blob = json.dumps( [ CACHE_VERSION, list( mobs.items() ), num_slots, manual_line ], separators=(',', ':') )
+    return hashlib.sha1( blob.encode() ).hexdigest()
+def load_cache( path ):
+    '''Map AreaName -> (key, slots). Missing or stale caches are empty'''
+    try:
+        with open( path ) as f:
+            data = json.load( f )
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+    if data.get( 'version' ) != CACHE_VERSION: return {}
+    return { area: (key, slots) for area, (key, slots) in data['areas'].items() }
+def save_cache( path, cache ):
+    write_if_changed( path, json.dumps( { 'version': CACHE_VERSION, 'areas': cache }, separators=(',', ':') ) )
+class SlotMemo:
+    '''Bounded LRU of slot allocations keyed by the canonical (case-folded, sorted) count multiset + num_slots, optionally persisted.
+    Allocations are computed on the canonical order, so they only depend on the key; slots come back in the caller's order and casing'''
+    def __init__( self, maxsize = 1 << 16, path = None ):
+        self.maxsize = maxsize
+        self.path = path
+        self.entries = OrderedDict() # :: Map (((lowercase, count)...), num_slots) -> Map lowercase -> slots
+        self.hits = self.misses = self.evictions = 0
+        if path: self.load()
+    @staticmethod
+    def key( mobs, num_slots ):
+        return (tuple( sorted( (name.lower(), count) for name, count in mobs.items() ) ), num_slots)
+    def get( self, key ):
+        alloc = self.entries.get( key )
+        if alloc is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end( key )
+        return alloc
+    def put( self, key, alloc ):
+        self.entries[ key ] = alloc
+        self.entries.move_to_end( key )
+        while len( self.entries ) > self.maxsize:
+            self.entries.popitem( last=False )
+            self.evictions += 1
+    def compute_many( self, mobs_list, num_slots ):
+        '''Slot lists for many (case-normalized) Counters; only distinct missing multisets go through compute_spawner_slots_batch'''
+        keys = [ self.key( mobs, num_slots ) for mobs in mobs_list ]
+        allocs, missing = [], {} # :: []Alloc, Map Key -> Alloc (computed below; kept here since put may already have evicted it)
+        for key in keys:
+            if key in missing: # repeat of a multiset computed below; counts as a hit
+                self.hits += 1
+                allocs.append( None )
+                continue
+            alloc = self.get( key )
+            if alloc is None: missing[ key ] = None
+            allocs.append( alloc )
+        counts, names = build_count_matrix( [ dict( pairs ) for pairs, _ in missing ] )
+        for key, slots in zip( list( missing ), compute_spawner_slots_batch( counts, names, num_slots ) ):
+            missing[ key ] = dict( Counter( s for s in slots if s != '*' ) )
+            self.put( key, missing[ key ] )
+        results = []
+        for mobs, key, alloc in zip( mobs_list, keys, allocs ):
+            alloc = alloc if alloc is not None else missing[ key ]
+            slots = []
+            for name in mobs:
+                slots.extend( [name] * alloc.get( name.lower(), 0 ) )
+            slots.extend( ['*'] * (num_slots - len( slots )) )
+            results.append( slots )
+        return results
+    def stats( self, since = None ):
+        '''Counters, or their change since an earlier stats() when given (the memo is shared between jobs)'''
+        since = since or {}
+        hits, misses, evictions = self.hits - since.get( 'hits', 0 ), self.misses - since.get( 'misses', 0 ), self.evictions - since.get( 'evictions', 0 )
+        lookups = hits + misses
+        return { 'size': len( self.entries ), 'hits': hits, 'misses': misses, 'evictions': evictions, 'hit_rate': hits / lookups if lookups else 0.0 }
+    def load( self ):
+        try:
+            with open( self.path ) as f:
+                data = json.load( f )
+        except (FileNotFoundError, json.JSONDecodeError):
+            return
+        if data.get( 'version' ) != CACHE_VERSION: return
+        for pairs, num_slots, alloc in data['entries'][ -self.maxsize: ]:
+            self.entries[ (tuple( map( tuple, pairs ) ), num_slots) ] = alloc
+    def save( self ):
+        if not self.path: return
+        entries = [ [ pairs, num_slots, alloc ] for (pairs, num_slots), alloc in self.entries.items() ]
+        write_if_changed( self.path, json.dumps( { 'version': CACHE_VERSION, 'entries': entries }, separators=(',', ':') ) )
+def test_slot_memo_eviction( trials = 200, seed = 1 ):
+    '''A memo smaller than one batch must evict without losing that batch's results, and agree with an unbounded memo'''
+    import random
+    rng = random.Random( seed )
+    pool = [ f'MOB{i}' for i in range( 12 ) ]
+    mobs_list = [ Counter( { name: rng.randint( 1, 9 ) for name in rng.sample( pool, rng.randint( 1, 6 ) ) } ) for _ in range( trials ) ]
+    mobs_list += mobs_list[: trials // 4 ] # repeats within the batch
+    small = SlotMemo( maxsize=1 )
+    assert small.compute_many( mobs_list, 8 ) == SlotMemo().compute_many( mobs_list, 8 )
+    assert len( small.entries ) == 1 and small.evictions > 0
+def parse_manual( text ):
+    '''Map AreaName -> (diff, [8]CreatureName, line) from the manual block'''
+    entries = {}
+    for line in text.split( '\n' ):
+        fields = line.split( '#' )[0].split() # comments run to the end of the line
+        if not fields: continue
+        area, diff, *mobs = fields
         diff = int(diff)
         assert 1 < diff < 50000, f"Invalid difficulty {diff}"
-        assert area in spawns, f"Unknown area {area}"
-        assert len( creatures ) == 8, f"Expected 8 creatures for {area}"
-        spawns[ area ] = creatures
-        difficulty[ area ] = diff
-    
-    # display
-    for area in spawns:
-        pass
-        mobs = spawns[ area ]
-        powers = []
-        for mob in mobs:
-            if mob == '*': continue
-            cre = creatures[ mob ][0]
-            clvl = max( cre['class_levels'] )
-            plvl = cre['power_level']
-            hp = cre['hp_max']
-            power = max( clvl, plvl, hp/8 )
-            if power > 0:
-                powers.append( power )
-        area_power = max( powers ) if powers else -1
-        #print( f'{area} [{area_power}] {mobs}' )
-        #print( 'plevel', [ creatures[mob][0]['power_level'] if mob != '*' else '*' for mob in mobs ] )
-        #print( 'clvl  ', [ max(creatures[mob][0]['class_levels']) if mob != '*' else '*' for mob in mobs ] )
-        #print( 'hp_max', [ creatures[mob][0]['hp_max'] if mob != '*' else '*' for mob in mobs ] )
-    
+        entries[ area ] = (diff, mobs, ' '.join( fields ))
+    return entries
+
+def load_actors( path ):
+    '''Per-area hostile counts and CreatureTable from an actor_stats.json (see ingest_actors)'''
+    return ingest_actors( iter_actors( path ) )
+
+# Compiled actor stats: header, creature table (fixed-width resrefs), area index, (creature, count) pairs, area name string table.
+# Little-endian, sections back to back, read as numpy views over one mmap
+ACTORS_BIN_MAGIC = b'SGACTORS'
+ACTORS_BIN_VERSION = 1 # bump whenever the layout or ingest_actors changes
+ACTORS_BIN_HEADER = np.dtype( [ ('magic', 'S8'), ('version', '<u4'), ('num_creatures', '<u4'), ('num_areas', '<u4'), ('num_counts', '<u4'), ('len_strings', '<u4'),
+                                ('source_size', '<u8'), ('source_mtime_ns', '<u8'), ('source_sha1', 'u1', 20) ] )
+ACTORS_BIN_CREATURE = np.dtype( [ ('name', 'S8'), ('found_cre_file', 'u1'), ('hostile', 'u1'), ('allegience', 'u1'), ('class_levels', 'u1', 3), ('hp_max', '<u2'), ('power_level', '<u4') ] )
+ACTORS_BIN_AREA = np.dtype( [ ('name_offset', '<u4'), ('name_len', '<u4'), ('counts_offset', '<u4'), ('num_counts', '<u4') ] ) # into the string table / count pairs
+ACTORS_BIN_COUNT = np.dtype( [ ('creature', '<u4'), ('count', '<u4') ] )
+def file_sha1( path, chunk_size = 1 << 20 ):
+    h = hashlib.sha1()
+    with open( path, 'rb' ) as f:
+        while chunk := f.read( chunk_size ): h.update( chunk )
+    return h.digest()
+def save_actors_bin( path, areas, creatures, source_stat, source_sha1 ):
+    '''Compile the output of load_actors to path (atomically). Returns False, writing nothing, if a creature name is not an 8 byte resref'''
+    try:
+        names = [ name.encode( 'latin-1' ) for name in creatures.names ]
+    except UnicodeEncodeError:
+        return False
+    if any( len( name ) > 8 or name.endswith( b'\0' ) for name in names ): return False
+
+    table = np.zeros( len( names ), ACTORS_BIN_CREATURE )
+    table['name'] = names
+    for field in ('found_cre_file', 'hostile', 'allegience', 'hp_max', 'power_level'):
+        table[ field ] = getattr( creatures, field ).tolist()
+    table['class_levels'] = np.array( creatures.class_levels.tolist(), np.uint8 ).reshape( -1, 3 )
+
+    strings = bytearray()
+    index = np.zeros( len( areas ), ACTORS_BIN_AREA )
+    counts = np.zeros( sum( len( mobs ) for mobs in areas.values() ), ACTORS_BIN_COUNT )
+    n = 0
+    for i, (area, mobs) in enumerate( areas.items() ):
+        name = area.encode( 'utf-8' )
+        index[ i ] = (len( strings ), len( name ), n, len( mobs ))
+        strings += name
+        counts[ n : n + len( mobs ) ] = list( mobs.items() )
+        n += len( mobs )
+
+    header = np.zeros( 1, ACTORS_BIN_HEADER )
+    header[0] = (ACTORS_BIN_MAGIC, ACTORS_BIN_VERSION, len( table ), len( index ), len( counts ), len( strings ),
+                 source_stat.st_size, source_stat.st_mtime_ns, np.frombuffer( source_sha1, np.uint8 ))
+    write_atomic( path, b''.join( [ section.tobytes() for section in (header, table, index, counts) ] + [ strings ] ) )
+    return True
+def load_actors_bin( path, path_source ):
+    '''load_actors result from a compiled cache, or None if it is missing or was built from a different source.
+    A changed mtime with unchanged size and content (touch, copy) is accepted and the stored mtime refreshed'''
+    try:
+        with open( path, 'rb' ) as f:
+            mm = mmap.mmap( f.fileno(), 0, access=mmap.ACCESS_READ )
+    except (FileNotFoundError, ValueError): # ValueError: empty file
+        return None
+    try:
+        if len( mm ) < ACTORS_BIN_HEADER.itemsize: return None
+        header = np.frombuffer( mm, ACTORS_BIN_HEADER, 1 ).copy()[0]
+        if header['magic'] != ACTORS_BIN_MAGIC or header['version'] != ACTORS_BIN_VERSION: return None
+        st = os.stat( path_source )
+        if st.st_size != header['source_size']: return None
+        if st.st_mtime_ns != header['source_mtime_ns']:
+            if file_sha1( path_source ) != header['source_sha1'].tobytes(): return None
+            header['source_mtime_ns'] = st.st_mtime_ns
+            with open( path, 'r+b' ) as f:
+                f.write( header.tobytes() )
+
+        offset = ACTORS_BIN_HEADER.itemsize
+        sections = []
+        for dtype, count in ((ACTORS_BIN_CREATURE, header['num_creatures']), (ACTORS_BIN_AREA, header['num_areas']), (ACTORS_BIN_COUNT, header['num_counts'])):
+            sections.append( np.frombuffer( mm, dtype, int( count ), offset ) )
+            offset += dtype.itemsize * int( count )
+        table, index, counts = sections
+        strings = mm[ offset : offset + int( header['len_strings'] ) ]
+
+        creatures = CreatureTable()
+        creatures.names = [ sys.intern( name.decode( 'latin-1' ) ) for name in table['name'].tolist() ]
+        creatures.index = { sys.intern( name.lower() ): row for row, name in enumerate( creatures.names ) }
+        for field in ('found_cre_file', 'hostile', 'allegience', 'hp_max', 'power_level'):
+            setattr( creatures, field, array( getattr( creatures, field ).typecode, table[ field ].tolist() ) )
+        creatures.class_levels = array( 'B', table['class_levels'].tobytes() )
+
+        areas = {}
+        creature_ids, nums = counts['creature'].tolist(), counts['count'].tolist()
+        for name_offset, name_len, start, num in index.tolist():
+            area = sys.intern( strings[ name_offset : name_offset + name_len ].decode( 'utf-8' ) )
+            areas[ area ] = Counter( dict( zip( creature_ids[ start : start + num ], nums[ start : start + num ] ) ) )
+        del table, index, counts, sections
+        return areas, creatures
+    finally:
+        try:
+            mm.close()
+        except BufferError: # a view outlived an early return; the mapping goes away with it
+            pass
+def load_actors_cached( path, path_bin ):
+    '''load_actors through the compiled cache at path_bin, (re)building it when missing or stale'''
+    cached = load_actors_bin( path_bin, path )
+    if cached is not None: return cached
+    st, digest = os.stat( path ), file_sha1( path )
+    areas, creatures = load_actors( path )
+    save_actors_bin( path_bin, areas, creatures, st, digest )
+    return areas, creatures
+def group_difficulty( slot_lists, creatures, default_difficulty = DEFAULT_DIFFICULTY, scale = DIFFICULTY_PER_POWER ):
+    '''Difficulty per slot list in one vectorized pass: mean power of its non-empty slots * scale, clamped to what the manual block allows.
+    Lists without any known powered creature (or scale None) get default_difficulty'''
+    if scale is None or not slot_lists: return [ default_difficulty ] * len( slot_lists )
+    rows = np.array( [ [ creatures.index.get( mob.lower(), -1 ) if mob != '*' else -1 for mob in slots ] for slots in slot_lists ], dtype=np.int64 )
+    power = creatures.power()
+    slot_power = np.where( rows >= 0, power[ np.maximum( rows, 0 ) ] if len( power ) else 0, 0 )
+    n = (slot_power > 0).sum( axis=1 )
+    mean = slot_power.sum( axis=1 ) / np.maximum( n, 1 )
+    diff = np.clip( np.rint( mean * scale ), 2, 49999 ).astype( np.int64 )
+    return np.where( n > 0, diff, default_difficulty ).tolist()
+def update_groups( groups, areas, creatures, overrides = None, default_difficulty = DEFAULT_DIFFICULTY, path_cache = None, memo = None, difficulty_scale = DIFFICULTY_PER_POWER, stats = None,
+                   only = None ):
+    '''Add or replace an RD<area> spawn group in groups for every area, or just the areas in only (neighbors still come from all areas;
+    the rebuild cache is neither read nor written then). Does not modify areas or creatures'''
+    num_slots = groups.nrows - 1 # difficulty row + creature slots
+    overrides = overrides or {}
+    memo = memo or SlotMemo()
+    stats = stats or Stats()
+    spawns = {} # :: Map AreaName -> [8]CreatureName
+    difficulty = {} # :: Map AreaName -> Diff
+    if only is not None: path_cache = None
+    cache_old = load_cache( path_cache ) if path_cache else {}
+    cache = {} # :: Map AreaName -> (key, [8]CreatureName)
+    targets = list( areas ) if only is None else [ area for area in areas if area in only ]
+
+    # calculate slots for each area based on frequency analysis
+    area_mobs = [] # :: [](AreaName, key, Counter[CreatureName])
+    with stats.stage( 'neighbor_fill' ):
+        prefixes = PrefixIndex( areas )
+        for area in targets:
+            mobs = areas[ area ]
+            stats.count( 'areas' )
+
+            # widen to areas sharing a shorter name prefix; nearer neighbors are counted once per step so they weigh more
+            neighbor_distance = 0
+            while (n := len( mobs )) < 4: # ids are already case-folded, so distinct ids == distinct enemies
+                if n == 0: break # probably a non-hostile area
+                if neighbor_distance >= len( area ): break # already filled from every area
+                neighbor_distance += 1
+                name_prefix = area[:-neighbor_distance]
+                stats.count( 'neighbor_fill_iterations' )
+                stats.warn( f"Warning: Area {area} has only {n} enemies {[ creatures.names[i] for i in mobs ]}. Filling with {name_prefix}*" )
+                mobs = mobs + prefixes.merged( name_prefix )
+
+            mobs = Counter( { creatures.names[i]: count for i, count in mobs.items() } )
+
+            # only recompute areas whose inputs changed since the cached run
+            key = area_key( mobs, num_slots, overrides[ area ][2] if area in overrides else '' )
+            if area in overrides:
+                cache[ area ] = (key, overrides[ area ][1])
+            elif cache_old.get( area, (None,) )[0] == key:
+                cache[ area ] = cache_old[ area ]
+                stats.count( 'areas_cached' )
+            else:
+                area_mobs.append( (area, key, mobs) )
+
+    with stats.stage( 'slot_allocation' ):
+        hits = memo.hits
+        for (area, key, mobs), slots in zip( area_mobs, memo.compute_many( [ mobs for area, key, mobs in area_mobs ], num_slots ) ):
+            cache[ area ] = (key, slots)
+        for area in targets:
+            spawns[ area ] = cache[ area ][1]
+        if path_cache: save_cache( path_cache, cache )
+        stats.count( 'areas_recomputed', len( area_mobs ) )
+        stats.count( 'memo_hits', memo.hits - hits )
+
+    # override with manual data when possible
+    with stats.stage( 'manual_overrides' ):
+        for area, (diff, mobs, line) in overrides.items():
+            assert area in areas, f"Unknown area {area}"
+            assert len( mobs ) == num_slots, f"Expected {num_slots} creatures for {area}"
+            if area not in spawns: continue # not in only
+            spawns[ area ] = mobs
+            difficulty[ area ] = diff
+        stats.count( 'manual_overrides', len( overrides ) )
+
+    # difficulty from the power profile of each group's slots, unless set manually
+    with stats.stage( 'difficulty' ):
+        auto = group_difficulty( [ spawns[ area ] for area in spawns ], creatures, default_difficulty, difficulty_scale )
+        for area, diff in zip( spawns, auto ):
+            difficulty.setdefault( area, diff )
+
     # update groups
-    for area in spawns:
-        group_name = f'RD{area}'
-        groups[ group_name ] = { 'name': group_name, 'diff': str( difficulty.get(area, DEFAULT_DIFFICULTY) ), 'creatures': spawns[ area ] }
-
-groups = load_2da( path_pristine )
-update_groups( groups )
-save_2da( path_output, groups )
-#test_gippity_math()
\ No newline at end of file
+    with stats.stage( 'update_columns' ):
+        for area in spawns:
+            groups.set_column( f'RD{area}', [ str( difficulty.get(area, default_difficulty) ), *spawns[ area ] ] )
+
+# Library / batch CLI
+_loaded = {} # :: Map (loader, path, mtime, args) -> result; read-only inputs shared by every job a worker runs
+def load_shared( loader, path, *args ):
+    key = (loader.__name__, os.path.abspath( path ), os.stat( path ).st_mtime_ns, args)
+    if key not in _loaded: _loaded[ key ] = loader( path, *args )
+    return _loaded[ key ]
+_memos = {} # :: Map MemoPath -> SlotMemo; shared by every job a worker runs
+def load_manual( path ):
+    with open( path ) as f:
+        return parse_manual( f.read() )
+def run_job( job ):
+    '''Build one SPAWNGRP.2da. job :: { game, actors, actors_cache?, manual?, profile?, pristine?, output?, cache?, memo?, patch_are?, trace_memory?, cprofile? }
+    profile :: { name?, default_difficulty?, difficulty_scale? }. patch_are also points each area's rest encounter at its RD group (see are.py). Returns a summary dict including the stage/counter report'''
+    game = job['game']
+    profile = job.get( 'profile' ) or {}
+    path_in = job.get( 'pristine' ) or os.path.join( game, 'override.pristine', 'SPAWNGRP.2da' )
+    path_out = job.get( 'output' ) or os.path.join( game, 'override', 'SPAWNGRP.2da' )
+
+    with Stats( job.get( 'trace_memory', False ), job.get( 'cprofile', False ) ) as stats:
+        with stats.stage( 'load_2da' ):
+            groups = load_shared( load_2da, path_in ).copy()
+        with stats.stage( 'ingest_actors' ): # streaming json parse + per-area aggregation
+            if job.get( 'actors_cache' ):
+                areas, creatures = load_shared( load_actors_cached, job['actors'], job['actors_cache'] )
+            else:
+                areas, creatures = load_shared( load_actors, job['actors'] )
+        overrides = load_shared( load_manual, job['manual'] ) if job.get( 'manual' ) else parse_manual( manual )
+        path_memo = job.get( 'memo' )
+        if path_memo not in _memos: _memos[ path_memo ] = SlotMemo( path=path_memo )
+        memo = _memos[ path_memo ]
+        memo_before = memo.stats()
+        update_groups( groups, areas, creatures, overrides, default_difficulty=profile.get( 'default_difficulty', DEFAULT_DIFFICULTY ), path_cache=job.get( 'cache' ),
+                       memo=memo, difficulty_scale=profile.get( 'difficulty_scale', DIFFICULTY_PER_POWER ), stats=stats )
+        memo.save()
+        with stats.stage( 'save_2da' ):
+            wrote = save_2da( path_out, groups )
+        stats.count( 'columns_written', len( groups ) - 1 if wrote else 0 )
+        if job.get( 'patch_are' ):
+            with stats.stage( 'patch_are' ):
+                patched = patch_are( game, areas, warn=stats.warn )
+            stats.count( 'are_patched', len( patched ) )
+            stats.count( 'are_written', sum( patched.values() ) )
+    return { 'output': path_out, 'profile': profile.get( 'name', '' ), 'areas': len( areas ), 'columns': len( groups ) - 1, 'wrote': wrote, 'memo': memo.stats( since=memo_before ), 'stats': stats.report() }
+def patch_are( game, areas, workers = 8, warn = print ):
+    '''Rewrite the rest encounters of every area in game/override from override.pristine, falling back to the BIFs when there is a chitin.key.
+    Map AreaName -> wrote'''
+    dir_pristine, dir_override = os.path.join( game, 'override.pristine' ), os.path.join( game, 'override' )
+    if not os.path.exists( os.path.join( game, 'chitin.key' ) ):
+        return are.patch_areas( areas, dir_pristine, dir_override, workers=workers, warn=warn )
+    with Key( os.path.join( game, 'chitin.key' ) ) as key, BifCache( game ) as bifs:
+        return are.patch_areas( areas, dir_pristine, dir_override, workers=workers, key=key, bifs=bifs, warn=warn )
+def run_jobs( jobs, workers = None ):
+    '''Run jobs in a process pool (inline for a single job or workers=1), results in job order'''
+    if len( jobs ) <= 1 or workers == 1:
+        return [ run_job( job ) for job in jobs ]
+    with ProcessPoolExecutor( workers ) as pool:
+        return list( pool.map( run_job, jobs ) )
+# Watch mode
+class Watcher:
+    '''Resident state for --watch: the pristine table, creature table and per-area counts stay parsed between runs.
+    Inputs are polled (mtime, size); once a burst of writes has been quiet for debounce seconds, only the groups the changed inputs can affect are rebuilt'''
+    def __init__( self, job ):
+        self.job = job
+        self.profile = job.get( 'profile' ) or {}
+        self.paths = { # :: Map InputName -> path
+            'pristine': job.get( 'pristine' ) or os.path.join( job['game'], 'override.pristine', 'SPAWNGRP.2da' ),
+            'actors': job['actors'],
+        }
+        if job.get( 'manual' ): self.paths['manual'] = job['manual']
+        self.path_out = job.get( 'output' ) or os.path.join( job['game'], 'override', 'SPAWNGRP.2da' )
+        self.memo = SlotMemo( path=job.get( 'memo' ) )
+        self.pristine = self.groups = self.areas = self.creatures = None
+        self.overrides = {}
+    def snapshot( self ):
+        state = {}
+        for name, path in self.paths.items():
+            try:
+                st = os.stat( path )
+                state[ name ] = (st.st_mtime_ns, st.st_size)
+            except FileNotFoundError:
+                state[ name ] = None
+        return state
+    def load( self, names ):
+        '''(pristine, areas, creatures, overrides) with the named inputs re-read and the rest as of the last successful refresh.
+        Raises if one is missing or mid-write'''
+        pristine, areas, creatures, overrides = self.pristine, self.areas, self.creatures, self.overrides
+        if 'pristine' in names: pristine = load_2da( self.paths['pristine'] )
+        if 'actors' in names:
+            if self.job.get( 'actors_cache' ):
+                areas, creatures = load_actors_cached( self.paths['actors'], self.job['actors_cache'] )
+            else:
+                areas, creatures = load_actors( self.paths['actors'] )
+        if 'manual' in names: overrides = load_manual( self.paths['manual'] ) if 'manual' in self.paths else parse_manual( manual )
+        return pristine, areas, creatures, overrides
+    def affected( self, areas, creatures, overrides ):
+        '''Areas whose group may differ between the current state and these reloaded inputs, or None when everything must be rebuilt'''
+        if self.areas is None or self.areas.keys() != areas.keys(): return None
+        only = { area for area in areas.keys() | self.overrides.keys() if overrides.get( area ) != self.overrides.get( area ) }
+        if areas is not self.areas:
+            named = lambda areas, creatures, area: { creatures.names[i].lower(): n for i, n in areas[ area ].items() }
+            power = lambda creatures: dict( zip( creatures.index, creatures.power()[ list( creatures.index.values() ) ].tolist() ) )
+            old_power, new_power = power( self.creatures ), power( creatures )
+            repowered = { name for name in old_power.keys() | new_power.keys() if old_power.get( name ) != new_power.get( name ) }
+            for area in areas:
+                if len( areas[ area ] ) < 4 or len( self.areas[ area ] ) < 4: # neighbor filled, may read any changed area
+                    only.add( area )
+                elif named( areas, creatures, area ) != named( self.areas, self.creatures, area ):
+                    only.add( area )
+                elif repowered and any( mob.lower() in repowered for mob in self.groups[ f'RD{area}' ][1:] ):
+                    only.add( area )
+        return only
+    def refresh( self, names ):
+        '''Reload the changed inputs and rebuild what they affect. The new state is kept only once the 2DA is written, so a failed refresh
+        is diffed against the last good one next time. Returns (groups rebuilt, wrote)'''
+        pristine, areas, creatures, overrides = self.load( names )
+        only = None if 'pristine' in names or self.groups is None else self.affected( areas, creatures, overrides )
+        groups = pristine.copy() if only is None else self.groups.copy()
+        stats = Stats()
+        update_groups( groups, areas, creatures, overrides, default_difficulty=self.profile.get( 'default_difficulty', DEFAULT_DIFFICULTY ), memo=self.memo,
+                       difficulty_scale=self.profile.get( 'difficulty_scale', DIFFICULTY_PER_POWER ), stats=stats, only=only )
+        wrote = save_2da( self.path_out, groups )
+        self.pristine, self.areas, self.creatures, self.overrides, self.groups = pristine, areas, creatures, overrides, groups
+        self.memo.save()
+        return stats.counters['areas'], wrote
+    def run( self, interval = 0.05, debounce = 0.2 ):
+        seen = self.snapshot()
+        pending, last_change = set( self.paths ) | {'manual'}, 0.0 # first pass loads everything
+        while True:
+            now = self.snapshot()
+            changed = { name for name in now if now[ name ] != seen[ name ] }
+            if changed:
+                seen = now
+                pending |= changed
+                last_change = perf_counter()
+            elif pending and perf_counter() - last_change >= debounce:
+                t = perf_counter()
+                try:
+                    rebuilt, wrote = self.refresh( pending )
+                except (OSError, ValueError, KeyError, IndexError, AssertionError) as e: # json.JSONDecodeError is a ValueError
+                    print( f"Warning: {', '.join( sorted( pending ) )} not loadable yet ({e!r}); retrying after the next change" )
+                    last_change = float( 'inf' ) # keep pending
+                else:
+                    print( f"{', '.join( sorted( pending ) )} changed: {rebuilt} groups rebuilt, {self.path_out} {'written' if wrote else 'unchanged'} in {1e3*(perf_counter()-t):.1f} ms" )
+                    pending = set()
+            time.sleep( interval )
+def main( argv = None ):
+    import argparse
+    parser = argparse.ArgumentParser( description='Generate RD<area> rest spawn groups into SPAWNGRP.2da' )
+    parser.add_argument( '--jobs', help='JSON file with a list of jobs {game, actors, manual?, profile?, pristine?, output?, cache?, memo?}' )
+    parser.add_argument( '--game', default=PATH_GAME_BASE )
+    parser.add_argument( '--actors', default='bin/actor_stats.json' )
+    parser.add_argument( '--actors-cache', help='compiled actor stats (e.g. bin/actor_stats.bin), rebuilt when --actors changes' )
+    parser.add_argument( '--manual', help='manual overrides file, same format as the built-in manual block' )
+    parser.add_argument( '--difficulty', type=int, default=DEFAULT_DIFFICULTY, help='spawn group difficulty when it cannot be derived from creature power' )
+    parser.add_argument( '--difficulty-scale', type=float, default=DIFFICULTY_PER_POWER, help='difficulty per point of mean slot power' )
+    parser.add_argument( '--cache', default=path_cache )
+    parser.add_argument( '--memo', help='persist memoized slot allocations to this file' )
+    parser.add_argument( '--workers', type=int, default=None )
+    parser.add_argument( '--patch-are', action='store_true', help='also rewrite the rest encounters of each area ARE to use its RD spawn group' )
+    parser.add_argument( '--watch', action='store_true', help='stay resident and regenerate whenever the actors, pristine 2DA or manual file change' )
+    parser.add_argument( '--debounce', type=float, default=0.2, help='--watch: seconds without further writes before regenerating' )
+    parser.add_argument( '--report', help='write per-job stage timings, peak memory and counters to this JSON file' )
+    parser.add_argument( '--trace-memory', action='store_true', help='exact per-stage peak memory via tracemalloc (slower)' )
+    parser.add_argument( '--cprofile', action='store_true', help='include a cProfile summary in the report' )
+    args = parser.parse_args( argv )
+
+    if args.jobs:
+        with open( args.jobs ) as f:
+            jobs = json.load( f )
+    else:
+        jobs = [ { 'game': args.game, 'actors': args.actors, 'actors_cache': args.actors_cache, 'manual': args.manual, 'cache': args.cache, 'memo': args.memo, 'patch_are': args.patch_are, 'profile': { 'default_difficulty': args.difficulty, 'difficulty_scale': args.difficulty_scale } } ]
+    if args.watch:
+        assert len( jobs ) == 1, "--watch takes a single job"
+        try:
+            Watcher( jobs[0] ).run( debounce=args.debounce )
+        except KeyboardInterrupt:
+            pass
+        return
+    for job in jobs:
+        job.setdefault( 'trace_memory', args.trace_memory )
+        job.setdefault( 'cprofile', args.cprofile )
+    results = run_jobs( jobs, args.workers )
+    for result in results:
+        memo = result['memo']
+        timings = ' '.join( f"{name}={1e3*stage['seconds']:.1f}ms" for name, stage in result['stats']['stages'].items() )
+        print( f"{result['output']} [{result['profile']}]: {result['areas']} areas, {result['columns']} groups, {'written' if result['wrote'] else 'unchanged'}; memo {memo['hits']} hits {memo['misses']} misses; {timings}" )
+    if args.report:
+        write_if_changed( args.report, json.dumps( results, indent=1 ) )
+
+if __name__ == '__main__':
+    main()
+    #test_gippity_math()
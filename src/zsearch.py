@@ -0,0 +1,102 @@
+from   collections import namedtuple
+from   concurrent.futures import ProcessPoolExecutor, as_completed
+import hashlib
+import json
+import zlib
+
+from   fileio import write_atomic
+import sav # Sav.save recompresses through this module, so each imports the other
+
+# Find zlib parameters that reproduce an original compressed stream byte-for-byte, so patched files recompress without diff noise
+PATH_CACHE = 'bin/zparams_cache.json'
+ZParams = namedtuple( 'ZParams', 'level memlevel strategy wbits' )
+DEFAULT_PARAMS = ZParams( 9, 8, zlib.Z_DEFAULT_STRATEGY, 15 ) # what save_SAV / scratch.py use
+STRATEGIES = [ zlib.Z_DEFAULT_STRATEGY, zlib.Z_FILTERED, zlib.Z_HUFFMAN_ONLY, zlib.Z_RLE, zlib.Z_FIXED ]
+
+def zcompress( data, params ):
+    c = zlib.compressobj( params.level, zlib.DEFLATED, params.wbits, params.memlevel, params.strategy )
+    return c.compress( data ) + c.flush()
+def header_flevel( level, strategy ):
+    '''FLEVEL bits deflateInit writes into the zlib header for level/strategy'''
+    if strategy >= zlib.Z_HUFFMAN_ONLY or level < 2: return 0
+    if level < 6: return 1
+    if level == 6: return 2
+    return 3
+def candidates( blob ):
+    '''Every ZParams that could have produced blob, most likely first. A zlib header pins wbits and narrows level/strategy'''
+    cmf, flg = blob[0], blob[1]
+    if cmf & 0x0f == 8 and (cmf << 8 | flg) % 31 == 0: # zlib wrapper
+        wbits_options = [ (cmf >> 4) + 8 ]
+        flevel = flg >> 6
+    else: # raw deflate
+        wbits_options = [ -w for w in range( 15, 8, -1 ) ]
+        flevel = None
+    cands = []
+    for wbits in wbits_options:
+        for level in [ 9, 6 ] + [ l for l in range( 10 ) if l not in (9, 6) ]:
+            for strategy in STRATEGIES:
+                if flevel is not None and header_flevel( level, strategy ) != flevel: continue
+                for memlevel in [ 8, 9 ] + list( range( 7, 0, -1 ) ):
+                    cands.append( ZParams( level, memlevel, strategy, wbits ) )
+    cands.sort( key=lambda p: p != DEFAULT_PARAMS ) # stable, so only hoists the default
+    return cands
+def search_chunk( data, blob, chunk ):
+    for params in chunk:
+        if zcompress( data, params ) == blob: return params
+    return None
+
+def load_cache( path = PATH_CACHE ):
+    '''Map sha1(original stream) -> ZParams, or None when nothing matched'''
+    try:
+        with open( path ) as f:
+            return { k: ZParams( *v ) if v else None for k, v in json.load( f ).items() }
+    except FileNotFoundError:
+        return {}
+def save_cache( cache, path = PATH_CACHE ):
+    write_atomic( path, json.dumps( { k: list( v ) if v else None for k, v in cache.items() } ) )
+def find_params( blob, pool, cache, data = None, chunk_size = 24 ):
+    '''ZParams reproducing blob exactly, or None. Searches in parallel on pool and stops at the first hit. Results are cached by content hash'''
+    key = hashlib.sha1( blob ).hexdigest()
+    if key in cache: return cache[ key ]
+    if data is None: data = zlib.decompressobj( wbits=0 if blob[0] & 0x0f == 8 else -15 ).decompress( blob )
+    cands = candidates( blob )
+    hit = search_chunk( data, blob, cands[:1] ) # the usual suspect, skip the pool round-trip
+    if hit is None:
+        futures = [ pool.submit( search_chunk, data, blob, cands[ i : i + chunk_size ] ) for i in range( 1, len( cands ), chunk_size ) ]
+        for future in as_completed( futures ):
+            hit = future.result()
+            if hit is not None: break
+        for future in futures: future.cancel()
+    cache[ key ] = hit
+    return hit
+def recompress( data, blob_original, cache ):
+    '''Compress data with the parameters found for its original stream (DEFAULT_PARAMS if unknown or there is none)'''
+    params = cache.get( hashlib.sha1( blob_original ).hexdigest() ) if blob_original is not None else None
+    return zcompress( data, params or DEFAULT_PARAMS )
+
+def iter_streams( path ):
+    '''(label, compressed stream) for each SAV entry, or the whole file for a compressed ARE'''
+    if open( path, 'rb' ).read( 8 ) == sav.SAV_SIGNATURE:
+        archive = sav.Sav( path )
+        for name, entry in archive.entries.items():
+            yield f'{path}:{name}', entry.original
+    else:
+        yield path, open( path, 'rb' ).read()
+
+if __name__ == '__main__':
+    import argparse
+    from time import perf_counter
+    parser = argparse.ArgumentParser( description='Find zlib level/memLevel/strategy/wbits that reproduce compressed ARE/SAV entries' )
+    parser.add_argument( 'paths', nargs='+', help='.SAV files or zlib-compressed .ARE files' )
+    parser.add_argument( '--workers', type=int, default=None )
+    parser.add_argument( '--cache', default=PATH_CACHE )
+    args = parser.parse_args()
+
+    cache = load_cache( args.cache )
+    with ProcessPoolExecutor( args.workers ) as pool:
+        for path in args.paths:
+            for label, blob in iter_streams( path ):
+                t = perf_counter()
+                params = find_params( blob, pool, cache )
+                print( f'{label}: {tuple( params ) if params else "no match"} ({1e3*(perf_counter()-t):.1f} ms)' )
+    save_cache( cache, args.cache )